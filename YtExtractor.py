@@ -0,0 +1,104 @@
+import concurrent.futures
+import itertools
+import json
+import queue
+import shlex
+import threading
+
+from YtShell import YtShell
+
+try:
+    import youtube_dl
+except ImportError:
+    youtube_dl = None
+
+class YtExtractorLogger:
+    # Errors are raised as exceptions. Anything else youtube-dl has
+    # to say would only end up on the console.
+    def debug(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+class YtExtractor:
+    """
+    Retrieves video information with youtube-dl. Running youtube-dl for every
+    lookup pays for starting a shell and a Python interpreter and importing
+    youtube-dl every time, which takes longer than many lookups themselves.
+    Instead, a few threads are started on first use, each with a YoutubeDL
+    instance of its own that is kept for as long as QTube runs. Lookups are
+    queued for them and waited for by the workers asking for them. Should the
+    youtube_dl package not be available, these threads run youtube-dl as a
+    command instead, as before. Either way, no more than a few lookups run at
+    the same time. Like YtThumbnailCache, this is meant to be a global singleton.
+    """
+    threadCount = 4
+    options = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'logger': YtExtractorLogger(),
+    }
+    # Urgent lookups, such as for the track about to be played, go first.
+    requests = queue.PriorityQueue()
+    order = itertools.count()
+    threads = []
+    lock = threading.Lock()
+
+    def command(query: str) -> str:
+        return f'youtube-dl -j -- {shlex.quote(query)}'
+
+    def submit(query: str, urgent: bool = False) -> concurrent.futures.Future:
+        """
+        Queues a lookup of a video ID, URL or search such as "ytsearch10:term".
+        The future returned results in a list of information for each video found.
+        """
+        future = concurrent.futures.Future()
+        with YtExtractor.lock:
+            if len(YtExtractor.threads) == 0:
+                for i in range(YtExtractor.threadCount):
+                    thread = threading.Thread(target = YtExtractor.work, daemon = True)
+                    thread.start()
+                    YtExtractor.threads.append(thread)
+        priority = 0 if urgent else 1
+        YtExtractor.requests.put((priority, next(YtExtractor.order), query, future))
+        return future
+
+    def extract(query: str, urgent: bool = False) -> list:
+        """ Like submit, but waits for the list of information. Errors are raised as exceptions. """
+        return YtExtractor.submit(query, urgent).result()
+
+    def work():
+        ydl = None
+        if youtube_dl != None:
+            ydl = youtube_dl.YoutubeDL(YtExtractor.options)
+        while True:
+            (priority, order, query, future) = YtExtractor.requests.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if ydl == None:
+                    future.set_result(YtExtractor.extractWithCommand(query))
+                else:
+                    result = ydl.extract_info(query, download = False)
+                    future.set_result(YtExtractor.entries(result))
+            except Exception as e:
+                future.set_exception(e)
+
+    def entries(result: dict) -> list:
+        if result == None:
+            return []
+        if result.get('_type') == 'playlist':
+            return [e for e in result['entries'] if e != None]
+        return [result]
+
+    def extractWithCommand(query: str) -> list:
+        results, errors = YtShell.pipeOutput(YtExtractor.command(query))
+        results = results.strip()
+        if results == '' and errors.strip() != '':
+            raise Exception(errors.strip())
+        return [json.loads(r) for r in results.split('\n') if r != '']
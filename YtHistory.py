@@ -0,0 +1,119 @@
+import json
+import os
+import pathlib
+import threading
+
+from YtPlaylistJournal import YtPlaylistJournal
+
+class YtHistory:
+    """
+    Keeps the tracks played last, up to a fixed number, so that the history
+    costs the same after months of use as after a day. Played tracks are
+    appended to a log, one line of tags each, and never written again. Once
+    the log holds as many tracks as the history, it is rotated, replacing the
+    previous one, so that the two logs together always hold the whole history
+    but never more than twice that. A track whose tags change, when it is
+    resolved for example, gets a line with its new tags, which refers to it by
+    its position counted from the end of the history at that point. Removing or
+    reordering tracks, which only happens when asked to, writes the history
+    once instead.
+
+    Like playlist changes, tracks are serialized right away, on the thread
+    playing them, and written whenever playlists are saved.
+    """
+    capacity = 1000
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.oldPath = pathlib.Path(f'{path}.1')
+        # Lines waiting to be written, or a list of lines replacing the history.
+        self.pending = []
+        self.lock = threading.Lock()
+        self.logCount = 0
+
+    def readLog(path: pathlib.Path) -> list:
+        try:
+            with open(path, encoding = 'utf8') as fp:
+                lines = fp.readlines()
+        except FileNotFoundError:
+            return []
+        tracks = []
+        for line in lines:
+            # The last line may be incomplete after a crash.
+            try:
+                tracks.append(json.loads(line))
+            except ValueError:
+                continue
+        return tracks
+
+    def load(self) -> list:
+        """ Returns the tags of the tracks in the history, oldest first. """
+        current = YtHistory.readLog(self.path)
+        self.logCount = sum(1 for item in current if isinstance(item, dict))
+        tracks = []
+        for item in YtHistory.readLog(self.oldPath) + current:
+            if isinstance(item, dict):
+                tracks.append(item)
+            elif -len(tracks) <= item[0] < 0:
+                # Updates to tracks that were rotated out already are ignored.
+                tracks[item[0]] = item[1]
+        return tracks[-YtHistory.capacity:]
+
+    def append(self, tracks: list):
+        lines = [json.dumps(tags) + '\n' for tags in tracks]
+        with self.lock:
+            self.pending.extend(lines)
+
+    def update(self, index: int, tags: dict):
+        """ Changes the tags of a track, given by its negative index from the end of the history. """
+        line = json.dumps([index, tags]) + '\n'
+        with self.lock:
+            self.pending.append(line)
+
+    def replace(self, tracks: list):
+        """ Replaces the whole history, which are tracks or their tags, or a snapshot. """
+        with self.lock:
+            self.pending = [tracks]
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+        lines = []
+        for item in pending:
+            if isinstance(item, str):
+                lines.append(item)
+                continue
+            # Replacing the history drops whatever was queued before, so this comes first.
+            if callable(item):
+                item = item()
+            tracks = [t if isinstance(t, dict) else t.getTags() for t in item]
+            data = ''.join(json.dumps(tags) + '\n' for tags in tracks[-YtHistory.capacity:])
+            YtPlaylistJournal.writeAtomically(self.path, data.encode('utf8'))
+            self.logCount = min(len(tracks), YtHistory.capacity)
+            try:
+                os.remove(self.oldPath)
+            except FileNotFoundError:
+                pass
+        if len(lines) == 0:
+            return
+        with open(self.path, 'a', encoding = 'utf8') as fp:
+            fp.write(''.join(lines))
+            fp.flush()
+            os.fsync(fp.fileno())
+        # Only tracks count, not updates to them.
+        self.logCount += sum(1 for line in lines if line.startswith('{'))
+        if self.logCount < YtHistory.capacity:
+            return
+        if self.logCount == YtHistory.capacity:
+            os.replace(self.path, self.oldPath)
+        else:
+            # More was played at once than fits, which the previous log does not need.
+            # Updates before the first track kept are to tracks that are dropped.
+            with open(self.path, encoding = 'utf8') as fp:
+                lines = fp.readlines()
+            starts = [i for (i, line) in enumerate(lines) if line.startswith('{')]
+            data = ''.join(lines[starts[-YtHistory.capacity]:])
+            YtPlaylistJournal.writeAtomically(self.oldPath, data.encode('utf8'))
+            os.remove(self.path)
+        self.logCount = 0
@@ -0,0 +1,55 @@
+import certifi
+import json
+import threading
+import urllib3
+
+class YtHttp:
+    """
+    Shared HTTP client for all workers. Opening a connection for every request,
+    with TLS for most of them, takes longer than many requests themselves, and
+    a single Last.fm search alone makes dozens of them. Connections are kept
+    open and reused instead, by all threads, with a limit on how many are open
+    to the same host at the same time. Requests time out rather than hang a
+    worker, and those failing for reasons likely to pass, such as a server
+    being busy, are retried a few times with increasing pauses in between.
+    Like YtThumbnailCache, this is meant to be a global singleton.
+    """
+    connectionsPerHost = 8
+    timeout = urllib3.Timeout(connect = 5, read = 15)
+    retries = urllib3.Retry(
+        total = 3,
+        backoff_factor = 0.5,
+        status_forcelist = (429, 500, 502, 503, 504),
+        allowed_methods = frozenset(['GET']),
+        # Responses are still returned after the last retry, so that
+        # error messages sent along by APIs can be read.
+        raise_on_status = False)
+    poolManager = None
+    lock = threading.Lock()
+
+    def pool() -> urllib3.PoolManager:
+        with YtHttp.lock:
+            if YtHttp.poolManager == None:
+                # Blocking, so that threads wait for a connection instead of opening more.
+                YtHttp.poolManager = urllib3.PoolManager(
+                    maxsize = YtHttp.connectionsPerHost,
+                    block = True,
+                    timeout = YtHttp.timeout,
+                    retries = YtHttp.retries,
+                    ca_certs = certifi.where())
+            return YtHttp.poolManager
+
+    def request(url: str, params: dict = None) -> urllib3.HTTPResponse:
+        """ Sends a GET request, with parameters added to the URL. """
+        return YtHttp.pool().request('GET', url, fields = params)
+
+    def get(url: str, params: dict = None) -> bytes:
+        """ Returns the body of the response, raising an exception for an error status. """
+        response = YtHttp.request(url, params)
+        if response.status >= 400:
+            raise Exception(f'HTTP Error {response.status}: {response.reason}')
+        return response.data
+
+    def getJson(url: str, params: dict = None):
+        """ Returns the parsed response, also for an error status, as APIs describe errors in them. """
+        return json.loads(YtHttp.request(url, params).data)
@@ -0,0 +1,397 @@
+import array
+import base64
+import bisect
+import heapq
+import json
+import math
+import pathlib
+import re
+import sys
+import threading
+import time
+
+from YtPlaylistJournal import YtPlaylistJournal
+
+class YtLibraryIndex:
+    """
+    Search index over the tracks of all playlists. Tracks are indexed by the
+    words in their title, channel, artist and album, and by their video ID.
+    Tracks with the same video ID, or the same title if they have none, are
+    indexed once, however many playlists they are in. Words of a search can
+    come in any order and can contain a typo each or be cut short.
+
+    The index is fed the same deltas that are recorded for saving playlists,
+    so that it never needs to look at tracks in playlists that are not loaded.
+    Deltas are only queued when recorded and applied on the next search or
+    save, which happen on background threads. It is saved to a file of its own
+    and only read once first needed. If the playlists it was saved with do not
+    match the playlists at startup, it is created again from all playlists on
+    the next search. The same goes for when playlists changed while it was not
+    read, since those changes are lost with quitting or a crash. A file next to
+    it tells so until it is saved again.
+
+    Tracks whose indexed words change are indexed again under a new number.
+    The old number is kept in the lists of tracks for each word until there are
+    enough of those to be worth dropping, and ignored until then.
+    """
+    fields = ('title', 'videoId', 'duration', 'channel', 'artist', 'album', 'track')
+    textFields = ('title', 'channel', 'artist', 'album')
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    wordPattern = re.compile(r'\w+')
+    # Changes kept for an index that has not been read. Beyond that, it is
+    # created again instead.
+    pendingLimit = 10000
+
+    def __init__(self, indexPath: pathlib.Path, playlistCounts: dict, saveInterval: float = 300):
+        """
+        Takes the number of tracks in each playlist at startup, which the index
+        file must match to be used.
+        """
+        self.indexPath = indexPath
+        self.stalePath = pathlib.Path(f'{indexPath}.stale')
+        self.playlistCounts = playlistCounts
+        self.saveInterval = saveInterval
+        self.excluded = set()
+        # Held while reading, changing or writing the index.
+        self.lock = threading.Lock()
+        # Held only briefly, since deltas are queued from the GUI thread.
+        self.pendingLock = threading.Lock()
+        self.pending = []
+        self.snapshot = None
+        self.snapshotMark = 0
+        self.loaded = False
+        # Whether the index file turned out not to be usable.
+        self.stale = self.stalePath.exists()
+        self.outdated = self.stale
+        self.dirty = False
+        self.savedAt = time.monotonic()
+        self.clear()
+
+    def clear(self):
+        # Each document is a list of key, number of occurrences in playlists,
+        # and a tuple of the values of the tags in fields.
+        self.documents = []
+        self.removedDocuments = 0
+        self.keys = {}
+        self.playlists = {}
+        self.postings = {}
+        self.vocabulary = None
+
+    def exclude(self, name: str):
+        """ Leaves out a playlist, such as search results, which would otherwise find themselves. """
+        self.excluded.add(name)
+        self.playlistCounts.pop(name, None)
+
+    def record(self, op: str, playlist: str, **fields):
+        if playlist in self.excluded:
+            return
+        with self.pendingLock:
+            if not self.loaded and self.snapshot == None and len(self.pending) >= YtLibraryIndex.pendingLimit:
+                self.pending = []
+                self.outdated = True
+            self.pending.append((op, playlist, fields))
+
+    def provideSnapshot(self, snapshot: dict):
+        """
+        Gives the current playlists for creating the index, in case the index
+        file cannot be used. Deltas recorded after this are applied on top.
+        """
+        with self.pendingLock:
+            if self.loaded:
+                return
+            self.snapshot = snapshot
+            self.snapshotMark = len(self.pending)
+
+    def ensureLoaded(self) -> bool:
+        """ Must be called with the lock held. Returns whether the index could be loaded. """
+        if not self.loaded:
+            mark = 0
+            if self.outdated or not self.read():
+                self.outdated = True
+                with self.pendingLock:
+                    snapshot, mark = self.snapshot, self.snapshotMark
+                    if snapshot == None:
+                        # Whatever is pending will be part of the snapshot used later.
+                        self.pending = []
+                        return False
+                self.clear()
+                self.build(snapshot)
+            with self.pendingLock:
+                self.pending = self.pending[mark:]
+                self.snapshot = None
+                self.loaded = True
+        with self.pendingLock:
+            pending = self.pending
+            self.pending = []
+        for (op, playlist, fields) in pending:
+            self.apply(op, playlist, fields)
+        return True
+
+    def build(self, snapshot: dict):
+        for (name, tracks) in snapshot.items():
+            if name in self.excluded:
+                continue
+            if callable(tracks):
+                tags = tracks()
+            else:
+                tags = [t if isinstance(t, dict) else t.getTags() for t in tracks]
+            self.apply('createPlaylist', name, {})
+            self.apply('addTracks', name, { 'tracks': tags })
+        self.dirty = True
+
+    def read(self) -> bool:
+        try:
+            with open(self.indexPath) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, dict) or 'byteorder' not in data:
+            return False
+        counts = { name: len(keys) for (name, keys) in data['playlists'].items() }
+        if counts != self.playlistCounts or data['byteorder'] != sys.byteorder:
+            print('Library index does not match playlists and will be created again.')
+            return False
+        self.clear()
+        self.playlists = data['playlists']
+        for document in data['documents']:
+            if document != None:
+                document[2] = tuple(document[2])
+                self.keys[document[0]] = len(self.documents)
+            else:
+                self.removedDocuments += 1
+            self.documents.append(document)
+        for (word, numbers) in data['postings'].items():
+            self.postings[word] = array.array('I', base64.b64decode(numbers))
+        return True
+
+    def save(self, force: bool = False):
+        """ Writes the index if it has changed, at most once per save interval unless forced. """
+        with self.lock:
+            # An index never searched is not read just for saving. Changes stay
+            # queued until it is, but the index file is marked as missing them.
+            if not self.loaded:
+                with self.pendingLock:
+                    changed = len(self.pending) > 0 or self.outdated
+                if changed and not self.stale:
+                    YtPlaylistJournal.writeAtomically(self.stalePath, b'')
+                    self.stale = True
+                return
+            if not self.ensureLoaded() or not self.dirty:
+                return
+            if not force and time.monotonic() - self.savedAt < self.saveInterval:
+                return
+            if self.removedDocuments > len(self.documents) / 2:
+                self.compact()
+            data = {
+                # Numbers are saved in the byte order of this machine. The index
+                # is created again should the file be moved somewhere it differs.
+                'byteorder': sys.byteorder,
+                'playlists': self.playlists,
+                'documents': self.documents,
+                'postings': {
+                    word: base64.b64encode(numbers.tobytes()).decode()
+                    for (word, numbers) in self.postings.items() },
+            }
+            YtPlaylistJournal.writeAtomically(self.indexPath, json.dumps(data).encode())
+            if self.stale:
+                self.stalePath.unlink(missing_ok = True)
+                self.stale = False
+            self.dirty = False
+            self.savedAt = time.monotonic()
+
+    def compact(self):
+        numbers = array.array('I', [0]) * len(self.documents)
+        documents = []
+        for (number, document) in enumerate(self.documents):
+            if document != None:
+                numbers[number] = len(documents)
+                self.keys[document[0]] = len(documents)
+                documents.append(document)
+        for word in list(self.postings):
+            posting = array.array('I', [numbers[n] for n in self.postings[word] if self.documents[n] != None])
+            if len(posting) > 0:
+                self.postings[word] = posting
+            else:
+                del(self.postings[word])
+        self.documents = documents
+        self.removedDocuments = 0
+        self.vocabulary = None
+
+    def key(tags: dict) -> str:
+        if tags.get('videoId') != None:
+            return f'v:{tags["videoId"]}'
+        return f't:{str(tags.get("title")).casefold()}'
+
+    def words(values: tuple) -> set:
+        words = set()
+        for field in YtLibraryIndex.textFields:
+            value = values[YtLibraryIndex.fields.index(field)]
+            if value != None:
+                words.update(YtLibraryIndex.wordPattern.findall(str(value).casefold()))
+        videoId = values[YtLibraryIndex.fields.index('videoId')]
+        if videoId != None:
+            words.add(str(videoId).casefold())
+        return words
+
+    def addDocument(self, key: str, references: int, values: tuple):
+        number = len(self.documents)
+        self.documents.append([key, references, values])
+        self.keys[key] = number
+        for word in YtLibraryIndex.words(values):
+            posting = self.postings.get(word)
+            if posting == None:
+                posting = array.array('I')
+                self.postings[word] = posting
+                if self.vocabulary != None:
+                    bisect.insort(self.vocabulary, word)
+            posting.append(number)
+
+    def removeDocument(self, number: int):
+        document = self.documents[number]
+        self.documents[number] = None
+        self.removedDocuments += 1
+        if self.keys.get(document[0]) == number:
+            del(self.keys[document[0]])
+
+    def acquire(self, tags: dict) -> str:
+        key = YtLibraryIndex.key(tags)
+        number = self.keys.get(key)
+        if number == None:
+            self.addDocument(key, 1, tuple(tags.get(f) for f in YtLibraryIndex.fields))
+        else:
+            self.documents[number][1] += 1
+            self.refresh(number, tags)
+        return key
+
+    def release(self, key: str):
+        number = self.keys.get(key)
+        if number == None:
+            return
+        document = self.documents[number]
+        document[1] -= 1
+        if document[1] <= 0:
+            self.removeDocument(number)
+
+    def refresh(self, number: int, tags: dict):
+        document = self.documents[number]
+        values = tuple(tags.get(f) for f in YtLibraryIndex.fields)
+        if values == document[2]:
+            return
+        if YtLibraryIndex.words(values) == YtLibraryIndex.words(document[2]):
+            document[2] = values
+        else:
+            self.removeDocument(number)
+            self.addDocument(document[0], document[1], values)
+
+    def apply(self, op: str, name: str, fields: dict):
+        self.dirty = True
+        if op == 'createPlaylist':
+            self.playlists.setdefault(name, [])
+            return
+        keys = self.playlists.setdefault(name, [])
+        if op == 'removePlaylist' or op == 'clearPlaylist':
+            for key in keys:
+                self.release(key)
+            if op == 'removePlaylist':
+                del(self.playlists[name])
+            else:
+                keys.clear()
+        elif op == 'addTracks':
+            keys.extend(self.acquire(tags) for tags in fields['tracks'])
+        elif op == 'removeTracks':
+            removed = set(fields['indexes'])
+            for index in removed:
+                self.release(keys[index])
+            self.playlists[name] = [k for (i, k) in enumerate(keys) if i not in removed]
+        elif op == 'updateTrack':
+            index = fields['index']
+            tags = fields['tags']
+            if YtLibraryIndex.key(tags) == keys[index]:
+                self.refresh(self.keys[keys[index]], tags)
+            else:
+                self.release(keys[index])
+                keys[index] = self.acquire(tags)
+        elif op == 'orderTracks':
+            self.playlists[name] = [keys[i] for i in fields['indexes']]
+
+    def expansions(self, word: str) -> dict:
+        """
+        Returns indexed words that could have been meant by the given word, with
+        how similar they are to it: the word itself, words starting with it and
+        words one typo away, i.e. a letter missing, extra, replaced or swapped.
+        """
+        found = {}
+        if word in self.postings:
+            found[word] = 1.0
+        if len(word) < 3:
+            return found
+        if self.vocabulary == None:
+            self.vocabulary = sorted(self.postings)
+        start = bisect.bisect_left(self.vocabulary, word)
+        for candidate in self.vocabulary[start:start + 50]:
+            if not candidate.startswith(word):
+                break
+            found.setdefault(candidate, .8)
+        splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+        edits = set()
+        for (left, right) in splits:
+            if right:
+                edits.add(left + right[1:])
+            if len(right) > 1:
+                edits.add(left + right[1] + right[0] + right[2:])
+            for c in YtLibraryIndex.alphabet:
+                if right:
+                    edits.add(left + c + right[1:])
+                edits.add(left + c + right)
+        for candidate in edits:
+            if candidate in self.postings:
+                found.setdefault(candidate, .6)
+        return found
+
+    def search(self, term: str, limit: int = 50) -> list:
+        """ Returns the tags of the best matching tracks, best match first. """
+        with self.lock:
+            if not self.ensureLoaded():
+                return []
+            count = len(self.documents) - self.removedDocuments
+            if count == 0:
+                return []
+            queries = []
+            for word in set(YtLibraryIndex.wordPattern.findall(term.casefold())):
+                # Rare words say more about what is being looked for than common ones.
+                weighted = []
+                for (candidate, similarity) in self.expansions(word).items():
+                    posting = self.postings[candidate]
+                    weight = similarity * math.log(1 + count / len(posting))
+                    weighted.append((posting, weight))
+                if len(weighted) > 0:
+                    queries.append(weighted)
+            queries.sort(key = lambda weighted: sum(len(p) for (p, w) in weighted))
+            scores = {}
+            for weighted in queries:
+                best = {}
+                total = sum(len(p) for (p, w) in weighted)
+                if len(scores) >= limit and total > 4 * len(scores):
+                    # Only rank the tracks found so far, instead of going
+                    # through the many tracks that contain a common word.
+                    for (posting, weight) in weighted:
+                        common = set(posting)
+                        for number in scores:
+                            if number in common and best.get(number, 0) < weight:
+                                best[number] = weight
+                else:
+                    for (posting, weight) in weighted:
+                        for number in posting:
+                            if best.get(number, 0) < weight:
+                                best[number] = weight
+                for (number, weight) in best.items():
+                    scores[number] = scores.get(number, 0) + weight
+            documents = self.documents
+            hits = heapq.nlargest(
+                limit, (item for item in scores.items() if documents[item[0]] != None),
+                key = lambda item: item[1])
+            results = []
+            for (number, score) in hits:
+                values = documents[number][2]
+                results.append({ f: v for (f, v) in zip(YtLibraryIndex.fields, values) if v != None })
+            return results
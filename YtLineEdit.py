@@ -1,6 +1,6 @@
 from PyQt6 import QtCore, QtWidgets, QtGui
 
-# Subclassed to handle key press events. There appears to currently 
+# Subclassed to handle key press events. There appears to currently
 # be no signal for this and this is the proper way to catch them.
 class YtLineEdit(QtWidgets.QLineEdit):
     searchTriggered = QtCore.pyqtSignal(str)
@@ -8,10 +8,23 @@ class YtLineEdit(QtWidgets.QLineEdit):
 
     def __init__(self):
         super().__init__()
+        self.filtering = False
+        # Wait for a pause in typing before filtering, so that typing
+        # quickly does not filter the tracks for every single key.
+        self.filterTimer = QtCore.QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(150)
+        self.filterTimer.timeout.connect(self.updateFilter)
 
     def keyPressEvent(self, e: QtGui.QKeyEvent) -> None:
         super().keyPressEvent(e)
+        self.filterTimer.start()
+
+    def updateFilter(self):
         if self.text().startswith('/'):
+            self.filtering = True
             self.searchTriggered.emit(self.text()[1:])
-        else:
+        elif self.filtering:
+            # Typing regular search terms should not touch the track view.
+            self.filtering = False
             self.searchStopped.emit()
@@ -10,12 +10,15 @@ from YtSearchWorkerGoogle import YtSearchWorkerGoogle
 from YtInputWorker import YtInputWorker
 from YtLineEdit import YtLineEdit
 from YtPlaylistManager import YtPlayMode, YtPlaylistManager
-from YtPlaylistWorker import YtPlaylistWorker
+from YtPlayLog import YtPlayEnd
 from YtPlaylistView import YtPlaylistView
 from YtPlaylist import YtPlaylist
 from YtPositionLabel import YtPositionLabel
+from YtPrefetcher import YtPrefetcher
+from YtResolver import YtResolver
 from YtSearchWorkerYtdl import YtSearchWorkerYtdl
-from YtTrackInfoWorker import YtTrackInfoWorker
+from YtSearchWorkerLibrary import YtSearchWorkerLibrary
+from YtThumbnailCache import YtThumbnailCache
 from YtTrackView import YtTrackView
 from YtTrack import YtTrack
 from YtSearchWorkerLastFm import YtSearchWorkerLastFm
@@ -48,10 +51,15 @@ class YtMainWindow(QtWidgets.QWidget):
             print('Google API search will be disabled.')
 
         self.searchResultsName = '# Search Results'
+        YtThumbnailCache.loadBudget()
+        YtSearchWorkerLastFm.loadRateLimit()
         self.playlistManager = YtPlaylistManager()
+        self.playlistManager.libraryIndex.exclude(self.searchResultsName)
 
         self.threadPool = QtCore.QThreadPool.globalInstance()
         self.threadPool.setMaxThreadCount(os.cpu_count() * 10)
+        self.resolver = YtResolver(self.playlistManager)
+        self.prefetcher = YtPrefetcher(self.playlistManager, self.resolver)
 
         self.searchThreads = []
         self.searchWorker = None
@@ -59,8 +67,9 @@ class YtMainWindow(QtWidgets.QWidget):
         self.trackThread = None
         self.playingTrack = None
         self.timeSinceLastPlay = None
-        self.playlistWorker = YtPlaylistWorker(self.playlistManager)
-        self.threadPool.start(self.playlistWorker)
+        # When the playing track was first played, and for how long so far.
+        self.playStarted = None
+        self.playSeconds = 0
         self.setupUi()
 
         # Restore the last track that was playing when player quit.
@@ -79,11 +88,16 @@ class YtMainWindow(QtWidgets.QWidget):
         ## Widget Initialization
         self.player = YtYouTubePlayer()
         self.plNameEdit = QtWidgets.QLineEdit()
-        self.trackView = YtTrackView(self.playlistManager)
+        self.trackView = YtTrackView(self.playlistManager, self.resolver)
         self.searchEdit = YtLineEdit()
+        self.resolveProgress = QtWidgets.QProgressBar()
+        self.resolveProgress.setFormat('Retrieving track information: %v/%m')
+        self.resolveProgress.setVisible(False)
         self.playlistView = YtPlaylistView(self.playlistManager)
         self.playlistView.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarPolicy.ScrollBarAsNeeded)
         self.albumArt = YtAspectRatioLabel(self.playlistView)
+        # Title and track of a notification waiting for its thumbnail.
+        self.pendingNotification = None
         self.pauseButton = QtWidgets.QPushButton()
         self.pauseButton.setIcon(self.playIcon)
         self.nextButton = QtWidgets.QPushButton()        
@@ -102,6 +116,8 @@ class YtMainWindow(QtWidgets.QWidget):
         ## Signal Connections
         self.playlistManager.trackActivated.connect(self.playTrack)
         self.playlistManager.trackUpdated.connect(self.trackUpdated)
+        self.playlistManager.saveError.connect(self.showMessage)
+        YtThumbnailCache.signals.thumbnailLoaded.connect(self.thumbnailLoaded)
         self.playlistView.playlistSelected.connect(self.trackView.showPlaylist)
         self.trackView.doubleClicked.connect(self.playItem)
         self.trackView.findRelatedTracks.connect(self.findRelatedTracks)
@@ -122,6 +138,8 @@ class YtMainWindow(QtWidgets.QWidget):
         self.playlistManager.trackActivated.connect(self.player.playTrack)
         self.player.positionChanged.connect(self.positionEdit.update)
         self.player.positionChanged.connect(self.positionChanged)
+        self.resolver.progressChanged.connect(self.resolveProgressChanged)
+        self.resolver.resolveError.connect(self.showMessage)
 
         ## Layout
         self.leftSide = QtWidgets.QWidget()
@@ -134,6 +152,7 @@ class YtMainWindow(QtWidgets.QWidget):
         self.rightSide = QtWidgets.QWidget()
         self.rightSideLayout = QtWidgets.QVBoxLayout(self.rightSide)
         self.rightSideLayout.addWidget(self.searchEdit)
+        self.rightSideLayout.addWidget(self.resolveProgress)
         self.rightSideLayout.addWidget(self.trackView)
         self.rightSideLayout.setContentsMargins(0, 5, 5, 5)
 
@@ -248,13 +267,15 @@ class YtMainWindow(QtWidgets.QWidget):
 
     def closeEvent(self, event):
         self.updatePlaytime()
-        self.playlistManager.savePlaylists()
+        self.endPlay(YtPlayEnd.Stopped)
         self.playlistManager.savePlayingTrack()
+        self.playlistManager.flush(compact = True)
+        self.playlistManager.scheduler.stop()
         self.inputThread.quit()
-        self.playlistWorker.quit()
+        YtThumbnailCache.stop()
 
     def playmodePressed(self):
-        modes = [YtPlayMode.Normal, YtPlayMode.Shuffle, YtPlayMode.Loop]
+        modes = [YtPlayMode.Normal, YtPlayMode.Shuffle, YtPlayMode.Weighted, YtPlayMode.Loop]
         values = [m.value for m in modes]
         current = self.playmodeButton.text()
         index = values.index(current)
@@ -337,6 +358,7 @@ class YtMainWindow(QtWidgets.QWidget):
         term = self.searchEdit.text()
         ytPrefix = 'y:' # Search with youtube-dl.
         gApiPrefix = 'g:' # Search with Google API.
+        libraryPrefix = 'l:' # Search all playlists.
         if relatedTrack != None:
             if self.lastFmApiKey == None:
                 self.showMessage(
@@ -346,6 +368,8 @@ class YtMainWindow(QtWidgets.QWidget):
                 term, self.lastFmApiKey, relatedTrack = relatedTrack)
         elif term.startswith(ytPrefix):
             self.searchWorker = YtSearchWorkerYtdl(term[len(ytPrefix):])
+        elif term.startswith(libraryPrefix):
+            self.searchWorker = YtSearchWorkerLibrary(self.playlistManager, term[len(libraryPrefix):])
         elif term.startswith(gApiPrefix):
             if self.googleKeys == None:
                 self.showMessage(
@@ -375,6 +399,12 @@ class YtMainWindow(QtWidgets.QWidget):
             # Return style to normal to indicate that search has finished.
             self.searchEdit.setStyleSheet('')
 
+    def resolveProgressChanged(self, done: int, total: int):
+        self.resolveProgress.setMaximum(total)
+        self.resolveProgress.setValue(done)
+        # Single tracks are resolved quickly enough to not be worth showing.
+        self.resolveProgress.setVisible(total > 1 and done < total)
+
     def showMessage(self, error):
         self.errorMessage = QtWidgets.QMessageBox()
         self.errorMessage.setText(error)
@@ -387,22 +417,40 @@ class YtMainWindow(QtWidgets.QWidget):
         track = self.trackView.getTrack(index)
         self.playlistManager.activateTrack(track)
 
-    def updateAlbumArt(self, icon: QtGui.QIcon):
-        self.albumArt.setIcon(icon)
+    def updateAlbumArt(self, track: YtTrack):
+        YtThumbnailCache.pin('albumArt', {track.videoId})
+        icon = track.scaledIcon(YtThumbnailCache.albumArtSize)
+        # Until it has been read, the album art shown before is better than a placeholder.
+        if icon is not YtThumbnailCache.placeholder:
+            self.albumArt.setIcon(icon)
+
+    def showTrackNotification(self, title: str, track: YtTrack):
+        icon = track.scaledIcon(YtThumbnailCache.notificationSize)
+        if icon is YtThumbnailCache.placeholder:
+            # Shown once the thumbnail has been read.
+            self.pendingNotification = (title, track)
+            return
+        self.pendingNotification = None
+        self.showNotification(title, track.title, icon)
+
+    def thumbnailLoaded(self, videoId: str):
+        if self.pendingNotification != None and self.pendingNotification[1].videoId == videoId:
+            self.showTrackNotification(*self.pendingNotification)
+        track = self.playlistManager.getActiveTrack()
+        if track != None and track.videoId == videoId:
+            self.updateAlbumArt(track)
 
     def playTrack(self, track: YtTrack):
         self.pauseButton.setIcon(self.pauseIcon)
         self.setWindowTitle(track.title)
-        self.showNotification('Track Playing', track.title, track.icon)
-        self.updateAlbumArt(track.icon)
+        self.showTrackNotification('Track Playing', track)
+        self.updateAlbumArt(track)
         self.updateProgressBar(track)
 
-        if None in [ track.duration, track.channel, track.videoId, track.icon ]:
-            # Update track information in the background.
-            worker = YtTrackInfoWorker(track)
-            worker.trackUpdated.connect(self.playlistManager.updateTrack)
-            worker.trackError.connect(self.showMessage)
-            self.threadPool.start(worker)
+        if None in [ track.duration, track.channel, track.videoId ] or not track.hasIcon():
+            # Update track information in the background. The resolver applies it
+            # on this thread, like all changes to tracks, which snapshots rely on.
+            self.resolver.resolve([track], urgent = True)
 
     def updateProgressBar(self, track):
         if track.duration == None:
@@ -415,7 +463,7 @@ class YtMainWindow(QtWidgets.QWidget):
             return
         # Track duration could have changed with an update.
         self.updateProgressBar(track)
-        self.updateAlbumArt(track.icon)
+        self.updateAlbumArt(track)
 
     def playNext(self):
         self.playlistManager.activateNextTrack(loopOther = True)
@@ -428,6 +476,7 @@ class YtMainWindow(QtWidgets.QWidget):
             return
         self.playTime = int(time.time() - self.timeSinceLastPlay)
         self.playingTrack.playTime += self.playTime
+        self.playSeconds += self.playTime
         self.playlistManager.updateTrack(self.playingTrack)
         self.timeSinceLastPlay = None
 
@@ -435,6 +484,7 @@ class YtMainWindow(QtWidgets.QWidget):
         if status == YtPlayerState.Unstarted:
             # Update previous track before switching to new one.
             self.updatePlaytime()
+            self.endPlay(YtPlayEnd.Skipped)
             # Position updates can keep coming in for the previous 
             # track until this status is signalled. This prevents
             # position updates from bleeding over across tracks.
@@ -443,6 +493,9 @@ class YtMainWindow(QtWidgets.QWidget):
         if status == YtPlayerState.Playing:
             self.pauseButton.setIcon(self.pauseIcon)
             self.timeSinceLastPlay = time.time()
+            if self.playStarted == None:
+                self.playStarted = self.timeSinceLastPlay
+                self.playSeconds = 0
         else:
             self.pauseButton.setIcon(self.playIcon)
             self.updatePlaytime()
@@ -453,11 +506,18 @@ class YtMainWindow(QtWidgets.QWidget):
         if status == YtPlayerState.Ended:
             # A track that has finished should start off at the beginning.
             self.playingTrack.position = 0
+            self.endPlay(YtPlayEnd.Completed)
             # Even when looping is disabled, the YouTube player will return 
             # to the beginning at times. Prevent that by pausing playback.
             self.player.pause()
             self.playlistManager.activateNextTrack()
 
+    def endPlay(self, end: YtPlayEnd):
+        if self.playingTrack == None or self.playStarted == None:
+            return
+        self.playlistManager.recordPlay(self.playingTrack, self.playStarted, self.playSeconds, end)
+        self.playStarted = None
+
     def createPlaylist(self):
         name = self.plNameEdit.text()
         self.playlistManager.createPlaylist(name)
@@ -471,4 +531,4 @@ class YtMainWindow(QtWidgets.QWidget):
         if track == None:
             self.showNotification('QTube', 'No track playing.')
         else:
-            self.showNotification('Current Track', track.title, track.icon)
+            self.showTrackNotification('Current Track', track)
@@ -0,0 +1,121 @@
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+
+class YtMetadataCache:
+    """
+    Global cache for video information retrieved through youtube-dl, so that
+    tracks for the same video, such as copies in the history, or tracks with
+    the same title, do not need youtube-dl to run again. Information is kept
+    by video ID, and search terms refer to the video ID they were resolved to.
+    Failures are kept as well, for a shorter time, unless they look like they
+    were caused by the network. Like YtThumbnailCache, this is meant to be a
+    global singleton and has no self attribute.
+    """
+    databasePath = pathlib.Path(pathlib.Path.home(), '.qtube/metadata.db')
+    timeToLive = 30 * 24 * 60 * 60
+    failureTimeToLive = 60 * 60
+    # Failures with these in their error message are not worth remembering.
+    transientErrors = ('urlopen error', 'timed out', 'Temporary failure', 'HTTP Error 429', 'HTTP Error 5')
+    schema = """
+        CREATE TABLE IF NOT EXISTS videos (
+            videoId TEXT PRIMARY KEY,
+            info TEXT,
+            error TEXT,
+            fetched REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS searches (
+            term TEXT PRIMARY KEY,
+            videoId TEXT,
+            error TEXT,
+            fetched REAL NOT NULL);
+    """
+    # SQLite connections cannot be shared between threads and
+    # information is retrieved from many workers at once.
+    connections = threading.local()
+
+    def connection() -> sqlite3.Connection:
+        connection = getattr(YtMetadataCache.connections, 'connection', None)
+        if connection == None:
+            YtMetadataCache.databasePath.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(YtMetadataCache.databasePath, timeout = 10)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.executescript(YtMetadataCache.schema)
+            YtMetadataCache.connections.connection = connection
+        return connection
+
+    def normalizeTerm(term: str) -> str:
+        # Remove characters that needlessly eliminate matches.
+        for c in '"/':
+            term = term.replace(c, ' ')
+        return ' '.join(term.casefold().split())
+
+    def parseInfo(jvid: dict) -> dict:
+        """ Keeps only what is used of the JSON output of youtube-dl. """
+        return {
+            'id': jvid['id'],
+            'title': jvid['title'],
+            'duration': int(jvid['duration']),
+            'uploader': jvid['uploader'],
+            'thumbnails': [
+                { k: t[k] for k in ('url', 'width', 'height') if k in t }
+                for t in jvid['thumbnails'] ],
+        }
+
+    def isCurrent(fetched: float, error: str) -> bool:
+        timeToLive = YtMetadataCache.timeToLive if error == None else YtMetadataCache.failureTimeToLive
+        return time.time() - fetched < timeToLive
+
+    def lookupVideo(videoId: str) -> tuple:
+        """
+        Returns a tuple of information and error message, one of which is None,
+        or None if the video has not been looked up recently.
+        """
+        row = YtMetadataCache.connection().execute(
+            'SELECT info, error, fetched FROM videos WHERE videoId = ?', (videoId,)).fetchone()
+        if row == None or not YtMetadataCache.isCurrent(row[2], row[1]):
+            return None
+        if row[1] != None:
+            return None, row[1]
+        return json.loads(row[0]), None
+
+    def lookupSearch(term: str) -> tuple:
+        """ Like lookupVideo, for the video found for a search term. """
+        row = YtMetadataCache.connection().execute(
+            'SELECT videoId, error, fetched FROM searches WHERE term = ?',
+            (YtMetadataCache.normalizeTerm(term),)).fetchone()
+        if row == None or not YtMetadataCache.isCurrent(row[2], row[1]):
+            return None
+        if row[1] != None:
+            return None, row[1]
+        return YtMetadataCache.lookupVideo(row[0])
+
+    def storeInfo(info: dict, term: str = None):
+        connection = YtMetadataCache.connection()
+        now = time.time()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO videos (videoId, info, error, fetched) VALUES (?, ?, NULL, ?)',
+                (info['id'], json.dumps(info), now))
+            if term != None:
+                connection.execute(
+                    'INSERT OR REPLACE INTO searches (term, videoId, error, fetched) VALUES (?, ?, NULL, ?)',
+                    (YtMetadataCache.normalizeTerm(term), info['id'], now))
+
+    def isTransient(error: str) -> bool:
+        return error != None and any(e in error for e in YtMetadataCache.transientErrors)
+
+    def storeFailure(error: str, videoId: str = None, term: str = None):
+        connection = YtMetadataCache.connection()
+        now = time.time()
+        with connection:
+            if videoId != None:
+                connection.execute(
+                    'INSERT OR REPLACE INTO videos (videoId, info, error, fetched) VALUES (?, NULL, ?, ?)',
+                    (videoId, error, now))
+            else:
+                connection.execute(
+                    'INSERT OR REPLACE INTO searches (term, videoId, error, fetched) VALUES (?, NULL, ?, ?)',
+                    (YtMetadataCache.normalizeTerm(term), error, now))
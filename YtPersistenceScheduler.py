@@ -0,0 +1,123 @@
+import pathlib
+import threading
+import time
+import typing
+
+class YtPersistenceScheduler:
+    """
+    Writes things to disk on a thread of its own, so that the GUI never waits
+    for the disk while playing or searching. Anything that needs saving is
+    scheduled by name along with a function that saves it. Scheduling the same
+    name again before it was saved just replaces the function, so that a burst
+    of changes is saved once. Saving waits until nothing was scheduled for the
+    debounce time, but never longer than the maximum latency after the first
+    change, so that a steady stream of changes still gets saved now and then.
+    Both can be changed by writing them in seconds, separated by a space, into
+    the file "save_delay".
+
+    Saving that fails is reported once and tried again after the retry delay,
+    until it works.
+    """
+    delayPath = pathlib.Path(pathlib.Path.home(), '.qtube/save_delay')
+    retryDelay = 30.0
+
+    def __init__(self, debounce: float = 1.0, maxLatency: float = 10.0, reportError: typing.Callable = print):
+        self.debounce = debounce
+        self.maxLatency = maxLatency
+        self.reportError = reportError
+        # Save function, time of first and of last change by name.
+        self.tasks = {}
+        # Time to try again by name, for saves that failed.
+        self.retries = {}
+        # Names that failed last time they were saved, which were reported already.
+        self.failing = set()
+        self.condition = threading.Condition()
+        # Saves running right now, which flushing also has to wait for.
+        self.writing = 0
+        self.flushing = 0
+        self.stopping = False
+        self.thread = threading.Thread(target = self.run, name = 'YtPersistenceScheduler', daemon = True)
+        self.thread.start()
+
+    def loadDelays(self):
+        try:
+            with open(YtPersistenceScheduler.delayPath) as fp:
+                debounce, maxLatency = (float(s) for s in fp.read().split())
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            print(f'Could not read save delays: {e}')
+            return
+        with self.condition:
+            self.debounce = debounce
+            self.maxLatency = maxLatency
+            self.condition.notify_all()
+
+    def schedule(self, name: str, save: typing.Callable):
+        now = time.monotonic()
+        with self.condition:
+            first = self.tasks[name][1] if name in self.tasks else now
+            self.tasks[name] = (save, first, now)
+            self.condition.notify_all()
+
+    def dueTime(self, name: str) -> float:
+        _, first, last = self.tasks[name]
+        return max(min(last + self.debounce, first + self.maxLatency), self.retries.get(name, 0))
+
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopping and len(self.tasks) == 0:
+                        return
+                    now = time.monotonic()
+                    if self.flushing > 0 or self.stopping:
+                        due = list(self.tasks)
+                    else:
+                        due = [name for name in self.tasks if self.dueTime(name) <= now]
+                    if len(due) > 0:
+                        break
+                    timeout = None
+                    if len(self.tasks) > 0:
+                        timeout = min(self.dueTime(name) for name in self.tasks) - now
+                    self.condition.wait(timeout)
+                saves = [(name, self.tasks.pop(name)[0]) for name in due]
+                self.writing += 1
+            failed = []
+            for (name, save) in saves:
+                try:
+                    save()
+                except Exception as e:
+                    failed.append((name, save))
+                    if name not in self.failing:
+                        self.reportError(f'Could not save {name}, trying again later: {e}')
+            with self.condition:
+                self.writing -= 1
+                for (name, _) in saves:
+                    self.retries.pop(name, None)
+                    self.failing.discard(name)
+                self.failing.update(name for (name, _) in failed)
+                # Flushing only tries once more, so that quitting does not wait
+                # for a disk that stays full.
+                if self.flushing == 0 and not self.stopping:
+                    now = time.monotonic()
+                    for (name, save) in failed:
+                        self.tasks.setdefault(name, (save, now, now))
+                        self.retries[name] = now + YtPersistenceScheduler.retryDelay
+                self.condition.notify_all()
+
+    def flush(self):
+        """ Saves everything scheduled right away, and waits until it is saved. """
+        with self.condition:
+            self.flushing += 1
+            self.condition.notify_all()
+            while len(self.tasks) > 0 or self.writing > 0:
+                self.condition.wait()
+            self.flushing -= 1
+
+    def stop(self):
+        """ Saves everything scheduled and ends the thread. Nothing is saved after this. """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.thread.join()
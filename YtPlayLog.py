@@ -0,0 +1,210 @@
+import datetime
+import enum
+import json
+import os
+import pathlib
+import struct
+import threading
+
+from YtPlaylistJournal import YtPlaylistJournal
+from YtTrackKey import YtTrackKey
+
+class YtPlayEnd(enum.IntEnum):
+    Completed = 0
+    # Another track was started before this one ended.
+    Skipped = 1
+    # QTube was closed while playing.
+    Stopped = 2
+
+class YtPlayLog:
+    """
+    Keeps every play of a track: when it started, for how many seconds it was
+    listened to and how it ended. Plays are appended to a binary log of fixed
+    size records, which refer to tracks by number. Tracks are numbered in the
+    order they were first played, in a file of their own, along with their
+    title and artist or channel.
+
+    Totals by track, by artist or channel and by day are kept up to date with
+    every play and saved now and then, along with the number of plays they
+    include. Starting up only adds the plays saved since, so that statistics
+    never need to read through years of plays.
+
+    Like playlist changes, plays are queued on the GUI thread and written
+    whenever playlists are saved.
+    """
+    # Track number, start time, seconds listened and how the play ended.
+    record = struct.Struct('<IIIB')
+    # Totals are saved after this many plays, or when quitting.
+    saveInterval = 100
+
+    def __init__(self, configPath: pathlib.Path):
+        self.logPath = pathlib.Path(configPath, 'plays.log')
+        self.keysPath = pathlib.Path(configPath, 'plays.keys')
+        self.statsPath = pathlib.Path(configPath, 'plays.json')
+        self.pending = []
+        self.pendingLock = threading.Lock()
+        # Held while totals are changed or read.
+        self.lock = threading.Lock()
+        # Track numbers by key, and key, title and artist by track number.
+        self.numbers = {}
+        self.tracks = []
+        self.count = 0
+        self.savedCount = 0
+        self.clear()
+        self.load()
+
+    def clear(self):
+        # Plays, completed plays, skips, seconds and last play by track number.
+        self.byTrack = {}
+        # Plays and seconds by artist or channel, and by day.
+        self.byArtist = {}
+        self.byDay = {}
+        self.count = 0
+
+    def truncate(path: pathlib.Path, size: int):
+        with open(path, 'r+b') as fp:
+            fp.truncate(size)
+
+    def load(self):
+        try:
+            with open(self.keysPath, 'rb') as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            data = b''
+        # Whatever follows the last complete line was cut off while writing.
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            YtPlayLog.truncate(self.keysPath, end)
+        for line in data[:end].splitlines():
+            self.addKey(*json.loads(line))
+
+        try:
+            size = os.path.getsize(self.logPath)
+        except FileNotFoundError:
+            size = 0
+        records = size // YtPlayLog.record.size
+        if records * YtPlayLog.record.size < size:
+            YtPlayLog.truncate(self.logPath, records * YtPlayLog.record.size)
+
+        try:
+            with open(self.statsPath) as fp:
+                stats = json.load(fp)
+            self.byTrack = { int(n): v for (n, v) in stats['tracks'].items() if int(n) < len(self.tracks) }
+            self.byArtist = stats['artists']
+            self.byDay = { int(d): v for (d, v) in stats['days'].items() }
+            self.count = stats['count']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            print(f'Could not read listening statistics, counting again: {e}')
+            self.clear()
+        if self.count > records:
+            # The log was cut short, so the totals have plays that are gone.
+            self.clear()
+        self.savedCount = self.count
+        if self.count == records:
+            return
+        with open(self.logPath, 'rb') as fp:
+            fp.seek(self.count * YtPlayLog.record.size)
+            data = fp.read((records - self.count) * YtPlayLog.record.size)
+        for play in YtPlayLog.record.iter_unpack(data):
+            if play[0] >= len(self.tracks):
+                # The track went missing along with the end of the track file, so
+                # the play cannot be counted, but it is not looked at again.
+                self.count += 1
+                continue
+            self.add(*play)
+
+    def addKey(self, key: str, title: str, artist: str) -> int:
+        number = len(self.tracks)
+        self.numbers[key] = number
+        self.tracks.append((key, title, artist))
+        return number
+
+    def add(self, number: int, start: int, seconds: int, end: int):
+        """ Adds a play to the totals. """
+        totals = self.byTrack.setdefault(number, [0, 0, 0, 0, 0])
+        totals[0] += 1
+        if end == YtPlayEnd.Completed:
+            totals[1] += 1
+        elif end == YtPlayEnd.Skipped:
+            totals[2] += 1
+        totals[3] += seconds
+        totals[4] = max(totals[4], start)
+        for (group, key) in ((self.byArtist, self.tracks[number][2]), (self.byDay, YtPlayLog.day(start))):
+            totals = group.setdefault(key, [0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+        self.count += 1
+
+    def day(start: int) -> int:
+        return datetime.date.fromtimestamp(start).toordinal()
+
+    def artistOf(track) -> str:
+        for artist in (track.artist, track.channel):
+            if artist != None:
+                return artist
+        return ''
+
+    def recordPlay(self, track, start: float, seconds: float, end: YtPlayEnd):
+        play = (YtTrackKey.of(track), track.title, YtPlayLog.artistOf(track), int(start), int(seconds), int(end))
+        with self.pendingLock:
+            self.pending.append(play)
+
+    def flush(self, force: bool = False):
+        """ Writes plays recorded since, and the totals when due or forced. """
+        with self.pendingLock:
+            pending = self.pending
+            self.pending = []
+        keys = []
+        records = []
+        with self.lock:
+            for (key, title, artist, start, seconds, end) in pending:
+                number = self.numbers.get(key)
+                if number == None:
+                    number = self.addKey(key, title, artist)
+                    keys.append(json.dumps([key, title, artist]) + '\n')
+                records.append(YtPlayLog.record.pack(number, start, seconds, end))
+                self.add(number, start, seconds, end)
+        # Tracks are written before the plays that refer to them.
+        YtPlayLog.append(self.keysPath, ''.join(keys).encode('utf8'))
+        YtPlayLog.append(self.logPath, b''.join(records))
+        if self.count == self.savedCount or (not force and self.count - self.savedCount < YtPlayLog.saveInterval):
+            return
+        with self.lock:
+            stats = json.dumps({
+                'count': self.count,
+                'tracks': self.byTrack,
+                'artists': self.byArtist,
+                'days': self.byDay,
+            })
+            count = self.count
+        YtPlaylistJournal.writeAtomically(self.statsPath, stats.encode('utf8'))
+        self.savedCount = count
+
+    def append(path: pathlib.Path, data: bytes):
+        if len(data) == 0:
+            return
+        with open(path, 'ab') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def statistics(self, count: int = 10) -> str:
+        with self.lock:
+            seconds = sum(t[3] for t in self.byTrack.values())
+            lines = [f'{self.count} plays of {len(self.byTrack)} tracks, {seconds / 3600:.1f} hours']
+            lines.append('\nMost played tracks:')
+            top = sorted(self.byTrack.items(), key = lambda item: item[1][3], reverse = True)[:count]
+            for (number, (plays, completed, skipped, seconds, last)) in top:
+                lines.append(f'{self.tracks[number][1]}: {plays} plays, {skipped} skipped, {seconds / 60:.0f} min')
+            lines.append('\nMost played artists and channels:')
+            top = sorted(self.byArtist.items(), key = lambda item: item[1][1], reverse = True)[:count]
+            for (artist, (plays, seconds)) in top:
+                lines.append(f'{artist or "Unknown"}: {plays} plays, {seconds / 60:.0f} min')
+            lines.append('\nLast days:')
+            today = datetime.date.today().toordinal()
+            for day in range(today - 6, today + 1):
+                plays, seconds = self.byDay.get(day, (0, 0))
+                lines.append(f'{datetime.date.fromordinal(day)}: {plays} plays, {seconds / 60:.0f} min')
+        return '\n'.join(lines)
@@ -1,12 +1,190 @@
+import typing
+
+from YtPlaylistColumns import YtPlaylistColumns
+from YtShuffle import YtShuffle
+from YtSnapshot import YtSnapshot
+from YtTitleIndex import YtTitleIndex
 from YtTrack import YtTrack
 
 class YtPlaylist:
-    def __init__(self, name: str, tracks: list=None):
+    def __init__(self, name: str, tracks: list=None, loader: typing.Callable = None, count: int = 0):
+        """
+        Playlists can be created without loading their tracks, by passing a function
+        that returns the tags of its tracks instead. Tracks will then be created once
+        they are first accessed. Until then, the count passed in is used as length.
+        Tracks can be appended without loading a playlist, which is what happens to
+        the history playlist on every start, for example.
+        """
         self.name = name
-        if tracks == None:
-            self.tracks = []
+        self.loader = loader
+        self.count = count
+        self.appended = []
+        # Counts changes to tracks, so that derived data knows when it is outdated.
+        self.version = 0
+        self._columns = None
+        self._titleIndex = None
+        # Track indexes by track identity, created when first needed.
+        self._positions = None
+        self._shuffle = None
+        # Whether a snapshot shares the list of tracks, which then must not be changed.
+        self._shared = False
+        if tracks != None:
+            self._tracks = tracks
+        elif loader == None:
+            self._tracks = []
+        else:
+            self._tracks = None
+
+    @property
+    def tracks(self) -> list:
+        if self._tracks == None:
+            self.load()
+        return self._tracks
+
+    @tracks.setter
+    def tracks(self, tracks: list):
+        self._tracks = tracks
+        self._shared = False
+        self.loader = None
+        self.appended = []
+        self._positions = None
+        self._shuffle = None
+        self.changed()
+
+    def isLoaded(self) -> bool:
+        return self._tracks != None
+
+    def load(self):
+        tracks = []
+        for track in self.loader():
+            # Avoid passing title multiple times.
+            tags = {tag: track[tag] for tag in track if tag != 'title'}
+            tracks.append(YtTrack(track['title'], self, **tags))
+        self._tracks = tracks + self.appended
+        self._shared = False
+        self.loader = None
+        self.appended = []
+        self._positions = None
+
+    def extend(self, tracks: list):
+        for track in tracks:
+            track.playlist = self
+        titleIndex = self.currentTitleIndex()
+        if self._tracks == None:
+            self.appended.extend(tracks)
         else:
-            self.tracks = tracks
+            if self._positions != None:
+                start = len(self._tracks)
+                for (i, track) in enumerate(tracks):
+                    self._positions[id(track)] = start + i
+            if self._shared:
+                self._tracks = list(self._tracks)
+                self._shared = False
+            self._tracks.extend(tracks)
+        if self._shuffle != None:
+            self._shuffle.added(tracks)
+        self.changed()
+        # Search results keep coming in while the user may be filtering them.
+        if titleIndex != None:
+            titleIndex.extend(tracks)
+            titleIndex.version = self.version
+
+    def removeTracks(self, tracks: list) -> list:
+        """
+        Removes the given tracks in a single pass and returns the indexes they
+        had, in ascending order. Tracks not in this playlist are ignored.
+        """
+        remove = set()
+        for track in tracks:
+            index = self.trackIndex(track)
+            if index >= 0:
+                remove.add(index)
+        if len(remove) == 0:
+            return []
+        self._tracks = [t for (i, t) in enumerate(self._tracks) if i not in remove]
+        self._shared = False
+        self._positions = None
+        indexes = sorted(remove)
+        if self._shuffle != None:
+            self._shuffle.removed(indexes)
+        self.changed()
+        return indexes
+
+    def changed(self, track: YtTrack = None):
+        """ To be called whenever tracks have changed, or just the given track. """
+        titleIndex = self.currentTitleIndex()
+        self.version += 1
+        if track == None:
+            return
+        if titleIndex == None and self._shuffle == None:
+            return
+        index = self.trackIndex(track)
+        if index < 0:
+            return
+        if titleIndex != None:
+            titleIndex.update(index, track)
+            titleIndex.version = self.version
+        if self._shuffle != None:
+            self._shuffle.weightChanged(index, track)
+
+    def reorder(self, order: list):
+        """ Rearranges tracks so that the track at index order[i] ends up at index i. """
+        tracks = self.tracks
+        columns = self._columns
+        shuffle = self._shuffle
+        self.tracks = [tracks[i] for i in order]
+        # Rearranging columns is much cheaper than creating them again.
+        if columns != None and columns[0] == self.version - 1:
+            columns[1].reorder(order)
+            self._columns = (self.version, columns[1])
+        # So is renumbering tracks in the shuffle order, which also keeps its progress.
+        if shuffle != None:
+            shuffle.reordered(order)
+            self._shuffle = shuffle
+
+    def columns(self) -> YtPlaylistColumns:
+        if self._columns == None or self._columns[0] != self.version:
+            self._columns = (self.version, YtPlaylistColumns(self.tracks))
+        return self._columns[1]
+
+    def currentTitleIndex(self) -> YtTitleIndex:
+        if self._titleIndex == None or self._titleIndex.version != self.version:
+            return None
+        return self._titleIndex
+
+    def titleIndex(self) -> YtTitleIndex:
+        if self.currentTitleIndex() == None:
+            self._titleIndex = YtTitleIndex(self.tracks)
+            self._titleIndex.version = self.version
+        return self._titleIndex
+
+    def shuffle(self) -> YtShuffle:
+        if self._shuffle == None or len(self._shuffle) != len(self):
+            self._shuffle = YtShuffle(len(self))
+        return self._shuffle
+
+    def restoreShuffle(self, state: dict):
+        """ Continues shuffling where it was left off, if the playlist has not changed since. """
+        self._shuffle = YtShuffle(len(self), state)
+
+    def shuffleState(self) -> dict:
+        """ Returns the shuffle order if it changed since this was last asked for, or None. """
+        if self._shuffle == None or not self._shuffle.dirty:
+            return None
+        self._shuffle.dirty = False
+        return self._shuffle.state()
+
+    def snapshotTracks(self):
+        """
+        Returns the current tracks of this playlist for saving, which can be read
+        on another thread. For a playlist that has not been loaded, this is the
+        function returning the tags of its tracks, which can be called later.
+        """
+        if self._tracks == None and len(self.appended) == 0:
+            return self.loader
+        tracks = self.tracks
+        self._shared = True
+        return YtSnapshot(tracks)
     
     def __repr__(self) -> str:
         s = '\n'.join(f'{repr(t)}' for t in self.tracks)
@@ -28,16 +206,19 @@ class YtPlaylist:
         return iter(self.tracks)
 
     def __delitem__(self, track: YtTrack):
-        if track not in self.tracks:
-            return
-        index = self.tracks.index(track)
-        del(self.tracks[index])
+        self.removeTracks([track])
 
     def __len__(self):
-        return len(self.tracks)
+        if self._tracks == None:
+            return self.count + len(self.appended)
+        return len(self._tracks)
     
     def trackIndex(self, track: YtTrack) -> int:
-        try:
-            return self.tracks.index(track)
-        except ValueError:
+        tracks = self.tracks
+        if self._positions == None:
+            self._positions = { id(t): i for (i, t) in enumerate(tracks) }
+        index = self._positions.get(id(track), -1)
+        # Identities of tracks that are gone can be taken by new tracks.
+        if index < 0 or tracks[index] is not track:
             return -1
+        return index
@@ -0,0 +1,75 @@
+import numpy
+
+class YtPlaylistColumns:
+    """
+    Columns of a playlist's tracks, kept in arrays, so that sorting and summing up
+    tracks of very large playlists does not have to go through every track
+    object. Strings are stored once per distinct value, with each track
+    referring to its value by code.
+
+    The columns reflect the tracks at the time they were created. Playlists
+    create them again once they have changed in between.
+    """
+    numeric = ['duration', 'playTime', 'position']
+    strings = ['title', 'channel']
+
+    def __init__(self, tracks: list):
+        self.count = len(tracks)
+        self.arrays = {}
+        for attribute in YtPlaylistColumns.numeric:
+            values = (YtPlaylistColumns.toNumber(getattr(t, attribute)) for t in tracks)
+            self.arrays[attribute] = numpy.fromiter(values, dtype=numpy.int64, count=self.count)
+        self.values = {}
+        for attribute in YtPlaylistColumns.strings:
+            codes, values = YtPlaylistColumns.encode(getattr(t, attribute) for t in tracks)
+            self.arrays[attribute] = codes
+            self.values[attribute] = values
+
+    def toNumber(value) -> int:
+        # Durations from Last.fm come as strings.
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
+
+    def encode(strings) -> tuple:
+        codes = []
+        values = []
+        known = {}
+        for s in strings:
+            if s == None:
+                s = ''
+            code = known.get(s)
+            if code == None:
+                code = len(values)
+                known[s] = code
+                values.append(s)
+            codes.append(code)
+        return numpy.array(codes, dtype=numpy.int32), values
+
+    def reorder(self, order: list):
+        for attribute in self.arrays:
+            self.arrays[attribute] = self.arrays[attribute][order]
+
+    def supports(self, attribute: str) -> bool:
+        return attribute in self.arrays
+
+    def sortOrder(self, attribute: str, reverse: bool = False) -> numpy.ndarray:
+        """
+        Returns track indexes in sorted order. Like sorted, tracks comparing equal
+        keep their order, also when sorting in reverse. Strings are compared
+        regardless of case.
+        """
+        if attribute in self.values:
+            values = self.values[attribute]
+            ranks = numpy.empty(len(values), dtype=numpy.int64)
+            ranks[sorted(range(len(values)), key = lambda i: values[i].casefold())] = numpy.arange(len(values))
+            keys = ranks[self.arrays[attribute]]
+        else:
+            keys = self.arrays[attribute]
+        if reverse:
+            keys = -keys
+        return numpy.argsort(keys, kind='stable')
+
+    def total(self, attribute: str) -> int:
+        return int(self.arrays[attribute].sum())
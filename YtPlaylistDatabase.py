@@ -0,0 +1,183 @@
+import json
+import pathlib
+import sqlite3
+import threading
+
+class YtPlaylistDatabase:
+    """
+    SQLite store for playlists, as an alternative to the playlist file and its
+    journal. It accepts the same deltas as YtPlaylistJournal, but applies them
+    as row updates within a single transaction each time it is flushed. Only
+    playlist names and track counts are read when starting. The tracks of a
+    playlist are read once the playlist is first used.
+
+    Tags other than the title are kept in their own table, one row per tag
+    and JSON-encoded, so that tracks can have any tags without changing the
+    schema.
+    """
+    schema = """
+        CREATE TABLE IF NOT EXISTS playlists (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS tracks (
+            id INTEGER PRIMARY KEY,
+            playlist INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            title TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS tracks_position ON tracks(playlist, position);
+        CREATE TABLE IF NOT EXISTS tags (
+            track INTEGER NOT NULL REFERENCES tracks(id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            value TEXT,
+            PRIMARY KEY (track, name));
+    """
+
+    def __init__(self, databasePath: pathlib.Path):
+        self.databasePath = databasePath
+        self.lock = threading.Lock()
+        self.flushLock = threading.Lock()
+        self.pending = []
+        # SQLite connections cannot be shared between threads. Playlists are read
+        # on the GUI thread while changes are written from a background thread.
+        self.connections = threading.local()
+        self.connection().executescript(YtPlaylistDatabase.schema)
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.connections, 'connection', None)
+        if connection == None:
+            connection = sqlite3.connect(self.databasePath)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute('PRAGMA foreign_keys = ON')
+            self.connections.connection = connection
+        return connection
+
+    def isEmpty(self) -> bool:
+        row = self.connection().execute('SELECT COUNT(*) FROM playlists').fetchone()
+        return row[0] == 0
+
+    def load(self) -> list:
+        """
+        Returns a list of tuples of playlist name, track count and a function
+        returning the tags of the playlist's tracks.
+        """
+        rows = self.connection().execute("""
+            SELECT p.name, COUNT(t.id) FROM playlists p
+            LEFT JOIN tracks t ON t.playlist = p.id
+            GROUP BY p.id ORDER BY p.id""").fetchall()
+        return [(name, count, lambda name = name: self.loadTracks(name)) for (name, count) in rows]
+
+    def loadTracks(self, name: str) -> list:
+        connection = self.connection()
+        rows = connection.execute("""
+            SELECT t.id, t.title FROM tracks t JOIN playlists p ON t.playlist = p.id
+            WHERE p.name = ? ORDER BY t.position""", (name,)).fetchall()
+        tracks = {}
+        for (trackId, title) in rows:
+            tracks[trackId] = { 'title': title }
+        tags = connection.execute("""
+            SELECT g.track, g.name, g.value FROM tags g
+            JOIN tracks t ON g.track = t.id JOIN playlists p ON t.playlist = p.id
+            WHERE p.name = ?""", (name,))
+        for (trackId, tag, value) in tags:
+            tracks[trackId][tag] = json.loads(value)
+        return list(tracks.values())
+
+    def importPlaylists(self, playlists: list):
+        for (name, count, loader) in playlists:
+            self.record('createPlaylist', name)
+            self.record('addTracks', name, tracks = loader())
+        self.flush()
+
+    def record(self, op: str, playlist: str, **fields):
+        # Serialize right away, like the journal does, so that tracks changing
+        # before the next flush do not affect what is written.
+        delta = { 'op': op, 'playlist': playlist, **fields }
+        line = json.dumps(delta)
+        with self.lock:
+            self.pending.append(line)
+
+    def needsCompaction(self) -> bool:
+        return False
+
+    def hasDeltas(self) -> bool:
+        return False
+
+    def requestCompaction(self, snapshot: dict):
+        pass
+
+    def flush(self):
+        with self.flushLock:
+            with self.lock:
+                pending = list(self.pending)
+            if len(pending) == 0:
+                return
+            connection = self.connection()
+            with connection:
+                for line in pending:
+                    self.apply(connection, json.loads(line))
+            # Changes stay queued until they are committed, so that they are tried
+            # again with the next flush if the transaction was rolled back.
+            with self.lock:
+                del(self.pending[:len(pending)])
+
+    def playlistId(self, connection: sqlite3.Connection, name: str) -> int:
+        connection.execute('INSERT OR IGNORE INTO playlists (name) VALUES (?)', (name,))
+        row = connection.execute('SELECT id FROM playlists WHERE name = ?', (name,)).fetchone()
+        return row[0]
+
+    def insertTags(self, connection: sqlite3.Connection, trackId: int, tags: dict):
+        connection.executemany(
+            'INSERT INTO tags (track, name, value) VALUES (?, ?, ?)',
+            [(trackId, tag, json.dumps(value)) for (tag, value) in tags.items() if tag != 'title'])
+
+    def apply(self, connection: sqlite3.Connection, delta: dict):
+        op = delta['op']
+        name = delta['playlist']
+        if op == 'removePlaylist':
+            connection.execute('DELETE FROM playlists WHERE name = ?', (name,))
+            return
+        playlistId = self.playlistId(connection, name)
+        if op == 'clearPlaylist':
+            connection.execute('DELETE FROM tracks WHERE playlist = ?', (playlistId,))
+        elif op == 'addTracks':
+            row = connection.execute(
+                'SELECT COUNT(*) FROM tracks WHERE playlist = ?', (playlistId,)).fetchone()
+            position = row[0]
+            for tags in delta['tracks']:
+                cursor = connection.execute(
+                    'INSERT INTO tracks (playlist, position, title) VALUES (?, ?, ?)',
+                    (playlistId, position, tags['title']))
+                self.insertTags(connection, cursor.lastrowid, tags)
+                position += 1
+        elif op == 'removeTracks':
+            connection.executemany(
+                'DELETE FROM tracks WHERE playlist = ? AND position = ?',
+                [(playlistId, index) for index in delta['indexes']])
+            # Close the gaps left behind, so that positions stay track indexes.
+            connection.execute("""
+                WITH ranked AS (
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY position) - 1 AS rank
+                    FROM tracks WHERE playlist = ?)
+                UPDATE tracks SET position = ranked.rank FROM ranked
+                WHERE tracks.id = ranked.id AND tracks.position != ranked.rank""", (playlistId,))
+        elif op == 'updateTrack':
+            tags = delta['tags']
+            row = connection.execute(
+                'SELECT id FROM tracks WHERE playlist = ? AND position = ?',
+                (playlistId, delta['index'])).fetchone()
+            if row == None:
+                return
+            trackId = row[0]
+            connection.execute('UPDATE tracks SET title = ? WHERE id = ?', (tags['title'], trackId))
+            connection.execute('DELETE FROM tags WHERE track = ?', (trackId,))
+            self.insertTags(connection, trackId, tags)
+        elif op == 'orderTracks':
+            # Move tracks to negative positions first, so that no track that has
+            # already been moved is mistaken for one that has yet to be moved.
+            connection.executemany(
+                'UPDATE tracks SET position = ? WHERE playlist = ? AND position = ?',
+                [(-1 - new, playlistId, old) for (new, old) in enumerate(delta['indexes'])])
+            connection.execute(
+                'UPDATE tracks SET position = -1 - position WHERE playlist = ? AND position < 0',
+                (playlistId,))
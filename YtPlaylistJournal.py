@@ -0,0 +1,318 @@
+import functools
+import json
+import os
+import pathlib
+import threading
+
+class YtPlaylistJournal:
+    """
+    Append-only store for playlists. Rewriting all playlists whenever a single
+    track changes gets expensive with large libraries. Instead, every change to
+    playlists is recorded as a small delta and appended to a log next to the
+    playlist file. The playlist file itself is only rewritten once the log has
+    grown large enough in relation to it, which is called compaction here.
+
+    The first line of the log identifies the playlist file the log was started
+    for, by its inode, size and modification time. Deltas only get applied if
+    the playlist file still matches. This way, a crash during compaction can
+    never apply deltas twice: either the new playlist file is not in place yet
+    and the log matches the old one, or it is and the outdated log no longer
+    matches. A torn last line, which can be left behind by a crash while
+    appending, is ignored.
+
+    Deltas address tracks by their index in a playlist and can be replayed
+    directly on the deserialized lists of tags. Replaying them in the order
+    they were recorded restores the playlists as they were last seen.
+
+    When compacting, the offset and length of each playlist within the playlist
+    file are written to an index next to it. Starting up then only needs to read
+    that index, and a playlist is only parsed once its tracks are needed, so that
+    the time it takes to start does not grow with the number of tracks.
+    """
+    def __init__(self, playlistPath: pathlib.Path, compactionRatio: float = .5, compactionMinimum: int = 1 << 20):
+        self.playlistPath = playlistPath
+        self.logPath = pathlib.Path(f'{playlistPath}.log')
+        self.indexPath = pathlib.Path(f'{playlistPath}.index')
+        self.compactionRatio = compactionRatio
+        self.compactionMinimum = compactionMinimum
+        self.lock = threading.Lock()
+        self.flushLock = threading.Lock()
+        # Guards replacing the playlist file together with its index.
+        self.fileLock = threading.Lock()
+        self.index = {}
+        # Either serialized deltas or snapshots of playlists that are waiting
+        # to be compacted. They are written in the order they were recorded.
+        self.pending = []
+        self.compactionPending = False
+        self.compactionWanted = False
+        self.snapshotSize = 0
+        self.logSize = 0
+        # Deltas recorded since the playlist file was last written.
+        self.deltaCount = 0
+
+    def fingerprint(path: pathlib.Path) -> list:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+    def load(self) -> list:
+        """
+        Returns a list of tuples of playlist name, track count and a function
+        returning the tags of the playlist's tracks. Errors while parsing the
+        playlist file are passed on, so that a damaged library is never overwritten.
+        """
+        fingerprint = YtPlaylistJournal.fingerprint(self.playlistPath)
+        self.snapshotSize = fingerprint[1] if fingerprint != None else 0
+        index = self.readIndex(fingerprint)
+        if index != None:
+            # None stands for a playlist that has yet to be parsed.
+            self.index = index
+            playlists = { name: None for name in index }
+        else:
+            try:
+                data = self.playlistPath.read_bytes()
+            except FileNotFoundError:
+                data = None
+            playlists = json.loads(data) if data else {}
+            # Write an index for the next start.
+            self.compactionWanted = data != None
+
+        header, deltas = self.readLog()
+        if header != None and header.get('base') == fingerprint:
+            for delta in deltas:
+                name = delta['playlist']
+                if playlists.get(name, []) == None and delta['op'] not in ['removePlaylist', 'clearPlaylist']:
+                    playlists[name] = self.readPlaylist(name)
+                YtPlaylistJournal.replay(playlists, delta)
+            self.logSize = self.logPath.stat().st_size
+            self.deltaCount = len(deltas)
+        else:
+            if len(deltas) > 0:
+                print(f'Ignoring {self.logPath}: it does not belong to {self.playlistPath}.')
+            self.resetLog(fingerprint)
+
+        loaded = []
+        for (name, tags) in playlists.items():
+            if tags == None:
+                count = index[name][2]
+                # Compacting recognizes this, to copy the playlist without parsing it.
+                loaded.append((name, count, functools.partial(self.readPlaylist, name)))
+            else:
+                loaded.append((name, len(tags), lambda tags = tags: tags))
+        return loaded
+
+    def readIndex(self, fingerprint: list) -> dict:
+        try:
+            with open(self.indexPath, 'rb') as fp:
+                index = json.load(fp)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+        if fingerprint == None or index.get('fingerprint') != fingerprint:
+            return None
+        return { name: (offset, length, count) for (name, offset, length, count) in index['playlists'] }
+
+    def readPlaylist(self, name: str) -> list:
+        return json.loads(self.readSerialized(name)[0])
+
+    def readSerialized(self, name: str) -> tuple:
+        """ Returns the tracks of a playlist as serialized in the playlist file, and their count. """
+        with self.fileLock:
+            offset, length, count = self.index[name]
+            with open(self.playlistPath, 'rb') as fp:
+                fp.seek(offset)
+                return fp.read(length), count
+
+    def readLog(self) -> tuple:
+        try:
+            with open(self.logPath, 'rb') as fp:
+                lines = fp.read().split(b'\n')
+        except FileNotFoundError:
+            return None, []
+        try:
+            header = json.loads(lines[0])
+        except json.decoder.JSONDecodeError:
+            return None, []
+        deltas = []
+        for line in lines[1:]:
+            if len(line) == 0:
+                continue
+            try:
+                deltas.append(json.loads(line))
+            except json.decoder.JSONDecodeError:
+                # Only the last line can be incomplete, when appending was
+                # interrupted. Anything after that would be out of order.
+                break
+        return header, deltas
+
+    def replay(playlists: dict, delta: dict):
+        op = delta['op']
+        name = delta['playlist']
+        if op == 'createPlaylist':
+            playlists.setdefault(name, [])
+        elif op == 'removePlaylist':
+            playlists.pop(name, None)
+        elif op == 'clearPlaylist':
+            playlists[name] = []
+        elif op == 'addTracks':
+            playlists.setdefault(name, []).extend(delta['tracks'])
+        elif op == 'removeTracks':
+            tracks = playlists.get(name, [])
+            remove = set(delta['indexes'])
+            playlists[name] = [t for (i, t) in enumerate(tracks) if i not in remove]
+        elif op == 'updateTrack':
+            tracks = playlists.get(name, [])
+            index = delta['index']
+            if 0 <= index < len(tracks):
+                tracks[index] = delta['tags']
+        elif op == 'orderTracks':
+            tracks = playlists.get(name, [])
+            order = delta['indexes']
+            if sorted(order) == list(range(len(tracks))):
+                playlists[name] = [tracks[i] for i in order]
+
+    def record(self, op: str, playlist: str, **fields):
+        """
+        Serializes a delta right away, on the thread making the change, so that
+        later changes to the same tracks cannot leak into it before it is written.
+        """
+        delta = { 'op': op, 'playlist': playlist, **fields }
+        line = json.dumps(delta) + '\n'
+        with self.lock:
+            self.pending.append(line)
+            self.logSize += len(line)
+            self.deltaCount += 1
+
+    def needsCompaction(self) -> bool:
+        if self.compactionPending:
+            return False
+        if self.compactionWanted:
+            return True
+        threshold = max(self.compactionMinimum, self.snapshotSize * self.compactionRatio)
+        return self.logSize > threshold
+
+    def hasDeltas(self) -> bool:
+        """ Tells whether compacting would change the playlist file. """
+        return self.deltaCount > 0 or self.compactionWanted
+
+    def requestCompaction(self, snapshot: dict):
+        """
+        Queues a compaction of the given snapshot, which maps playlist names to
+        lists of tracks or tags, or to functions returning lists of tags, for
+        playlists that have not been loaded. Deltas recorded after this call go
+        to the new log.
+        """
+        with self.lock:
+            self.pending.append(snapshot)
+            self.compactionPending = True
+            self.compactionWanted = False
+
+    def flush(self):
+        """ Writes pending deltas and compactions, in the order they were recorded. """
+        with self.flushLock:
+            with self.lock:
+                pending = self.pending
+                self.pending = []
+            # Items before this one are on disk.
+            written = 0
+            try:
+                for (i, item) in enumerate(pending):
+                    if isinstance(item, str):
+                        continue
+                    self.appendLog(pending[written:i])
+                    written = i
+                    self.compact(item)
+                    written = i + 1
+                self.appendLog(pending[written:])
+                written = len(pending)
+            finally:
+                if written < len(pending):
+                    # Whatever could not be written is tried again with the next
+                    # flush, ahead of anything recorded since.
+                    with self.lock:
+                        self.pending = pending[written:] + self.pending
+                        self.compactionPending = any(not isinstance(i, str) for i in self.pending)
+
+    def appendLog(self, lines: list):
+        if len(lines) == 0:
+            return
+        data = memoryview(''.join(lines).encode('utf8'))
+        with open(self.logPath, 'ab', buffering = 0) as fp:
+            size = fp.tell()
+            try:
+                while len(data) > 0:
+                    data = data[fp.write(data):]
+                os.fsync(fp.fileno())
+            except Exception:
+                # A torn line would keep the lines appended after it from being
+                # replayed, so the log goes back to how it was.
+                fp.truncate(size)
+                raise
+
+    def compact(self, snapshot: dict):
+        playlists = {}
+        for (name, tracks) in snapshot.items():
+            if isinstance(tracks, functools.partial) and tracks.func == self.readPlaylist:
+                # Playlists that were never loaded have not changed since.
+                playlists[name] = self.readSerialized(*tracks.args)
+                continue
+            if callable(tracks):
+                tracks = tracks()
+            playlists[name] = [t if isinstance(t, dict) else t.getTags() for t in tracks]
+        data, index = YtPlaylistJournal.serialize(playlists)
+        # The playlist file is only replaced once it is complete. Until the new log
+        # replaces the old one, the old log will not match the new playlist file
+        # and will be ignored when loading, since the new file already contains it.
+        # The same goes for the index.
+        with self.fileLock:
+            YtPlaylistJournal.writeAtomically(self.playlistPath, data)
+            fingerprint = YtPlaylistJournal.fingerprint(self.playlistPath)
+            self.index = { name: (offset, length, count) for (name, offset, length, count) in index }
+        indexData = json.dumps({ 'fingerprint': fingerprint, 'playlists': index })
+        YtPlaylistJournal.writeAtomically(self.indexPath, indexData.encode('utf8'))
+        self.resetLog(fingerprint)
+        with self.lock:
+            self.snapshotSize = len(data)
+            self.logSize = sum(len(i) for i in self.pending if isinstance(i, str))
+            self.deltaCount = sum(1 for i in self.pending if isinstance(i, str))
+            self.compactionPending = any(not isinstance(i, str) for i in self.pending)
+
+    def serialize(playlists: dict) -> tuple:
+        """
+        Serializes playlists the same way json.dumps would, but also returns
+        the offset, length and track count of every playlist in the result.
+        Playlists are lists of tags, or tracks already serialized along with
+        their count.
+        """
+        parts = [b'{']
+        offset = 1
+        index = []
+        for (name, tracks) in playlists.items():
+            if len(index) > 0:
+                parts.append(b', ')
+                offset += 2
+            key = json.dumps(name).encode('utf8') + b': '
+            if isinstance(tracks, tuple):
+                value, count = tracks
+            else:
+                value, count = json.dumps(tracks).encode('utf8'), len(tracks)
+            offset += len(key)
+            index.append([name, offset, len(value), count])
+            offset += len(value)
+            parts.extend([key, value])
+        parts.append(b'}')
+        return b''.join(parts), index
+
+    def resetLog(self, fingerprint: list):
+        header = json.dumps({ 'base': fingerprint }) + '\n'
+        YtPlaylistJournal.writeAtomically(self.logPath, header.encode('utf8'))
+        self.logSize = len(header)
+
+    def writeAtomically(path: pathlib.Path, data: bytes):
+        tmpPath = pathlib.Path(f'{path}.tmp')
+        with open(tmpPath, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmpPath, path)
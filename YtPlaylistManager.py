@@ -1,15 +1,24 @@
 import json
-import numpy
 import pathlib
 from PyQt6 import QtCore
 import enum
+import typing
 
+from YtHistory import YtHistory
+from YtPersistenceScheduler import YtPersistenceScheduler
+from YtPlayLog import YtPlayLog
 from YtPlaylist import YtPlaylist
+from YtPlaylistDatabase import YtPlaylistDatabase
+from YtPlaylistJournal import YtPlaylistJournal
+from YtLibraryIndex import YtLibraryIndex
+from YtSafeSignal import YtSafeSignal
 from YtTrack import YtTrack
 
 class YtPlayMode(enum.Enum):
     Normal = 'N'
     Shuffle = 'S'
+    # Shuffle favoring tracks played longer.
+    Weighted = 'W'
     Loop = 'L'
 
 class YtPlaylistManager(QtCore.QObject):
@@ -28,31 +37,123 @@ class YtPlaylistManager(QtCore.QObject):
     trackUpdated = QtCore.pyqtSignal(YtTrack)
     tracksAdded = QtCore.pyqtSignal(YtPlaylist, list)
     tracksRemoved = QtCore.pyqtSignal(YtPlaylist, list)
+    playModeChanged = QtCore.pyqtSignal(object)
+    saveError = QtCore.pyqtSignal(str)
 
     def __init__(self):
         super().__init__()
         self.activePlaylist = None
         self.activeTrack = None
         self.playlists = []
+        # Playlists by name, since they are looked up by name all the time.
+        self.playlistIndex = {}
         self.playMode = YtPlayMode.Normal
-        self.isDirty = False
+        # All saving happens on its thread.
+        self.scheduler = YtPersistenceScheduler(reportError = lambda error: YtSafeSignal.emit(self.saveError, error))
+        self.scheduler.loadDelays()
         self.configPath = pathlib.Path(pathlib.Path.home(), '.qtube')
         self.currentTrackPath = pathlib.Path(self.configPath,  'currentTrack.json')
         self.playlistPath = pathlib.Path(self.configPath,  'playlists.json')
+        self.databasePath = pathlib.Path(self.configPath, 'playlists.db')
+        self.storagePath = pathlib.Path(self.configPath, 'storage')
+        self.libraryPath = pathlib.Path(self.configPath, 'library.json')
+        self.shufflePath = pathlib.Path(self.configPath, 'shuffle.json')
+        self.historyName = '# History'
+        self.history = YtHistory(pathlib.Path(self.configPath, 'history.log'))
+        self.playLog = YtPlayLog(self.configPath)
+        # Shuffle orders by playlist name, as last saved.
+        self.shuffleStates = {}
         self.thumbnailPath = pathlib.Path(self.configPath, 'thumbnails')
         self.thumbnailPath.mkdir(parents=True, exist_ok=True)
         self.iconCache = {}
+        self.playlistStore = self.createStore()
         self.loadPlaylists()
+        self.libraryIndex = YtLibraryIndex(self.libraryPath, { pl.name: len(pl) for pl in self.playlists })
+        self.loadHistory()
+        self.loadShuffles()
 
     def updateTrack(self, track):
         self.trackUpdated.emit(track)
-        self.setDirty()
+        playlist = track.playlist
+        if playlist == None or self.getPlaylist(playlist.name) is not playlist:
+            return
+        playlist.changed(track)
+        index = playlist.trackIndex(track)
+        if index >= 0:
+            self.record('updateTrack', playlist, index = index, tags = track.getTags())
         
     def setPlayMode(self, playMode: YtPlayMode):
         self.playMode = playMode
+        self.playModeChanged.emit(playMode)
 
     def setDirty(self):
-        self.isDirty = True
+        self.scheduler.schedule('playlists', self.savePlaylists)
+        self.saveShuffles()
+
+    def flush(self, compact: bool = False):
+        """ Saves everything right away and waits for it, which is meant for quitting. """
+        self.saveShuffles()
+        if compact:
+            # The playlist file is only rewritten if it does not hold every change yet.
+            if self.playlistStore.hasDeltas():
+                self.compactPlaylists()
+            self.scheduler.schedule('playlists', lambda: self.savePlaylists(force = True))
+        self.scheduler.flush()
+
+    def compactPlaylists(self):
+        """
+        Has the next save rewrite the whole playlist file, which is what should happen
+        before quitting, so that the playlist file can be copied or edited while QTube
+        is not running. Like all snapshots, this one has to be taken on the GUI thread.
+        """
+        self.playlistStore.requestCompaction(self.playlistSnapshot())
+
+    def record(self, op: str, playlist: YtPlaylist, **fields):
+        # Every change to playlists is recorded, so that saving does not need to
+        # rewrite the whole library. The journal asks to be compacted from time to
+        # time, which needs the tracks as they are at the time of this change.
+        if playlist.name == self.historyName:
+            self.recordHistory(op, playlist, **fields)
+            self.setDirty()
+            return
+        self.playlistStore.record(op, playlist.name, **fields)
+        self.libraryIndex.record(op, playlist.name, **fields)
+        if self.playlistStore.needsCompaction():
+            self.playlistStore.requestCompaction(self.playlistSnapshot())
+        self.setDirty()
+
+    def recordHistory(self, op: str, playlist: YtPlaylist, **fields):
+        if op == 'addTracks':
+            self.history.append(fields['tracks'])
+        elif op == 'updateTrack':
+            self.history.update(fields['index'] - len(playlist), fields['tags'])
+        elif op == 'removePlaylist':
+            self.history.replace([])
+        elif op != 'createPlaylist':
+            self.history.replace(playlist.snapshotTracks())
+
+    def playlistSnapshot(self) -> dict:
+        return { pl.name: pl.snapshotTracks() for pl in self.playlists if pl.name != self.historyName }
+
+    def createStore(self):
+        """
+        Playlists are kept in a JSON file by default. Writing "sqlite" into the file
+        "storage" in the configuration directory switches to an SQLite database,
+        which is better suited for very large libraries. Existing playlists will be
+        imported into the database the first time.
+        """
+        storage = 'json'
+        try:
+            with open(self.storagePath) as fp:
+                storage = fp.read().strip()
+        except FileNotFoundError:
+            pass
+        if storage != 'sqlite':
+            return YtPlaylistJournal(self.playlistPath)
+        database = YtPlaylistDatabase(self.databasePath)
+        if database.isEmpty() and self.playlistPath.exists():
+            database.importPlaylists(YtPlaylistJournal(self.playlistPath).load())
+        return database
         
     def getActiveTrack(self) -> YtTrack:
         return self.activeTrack
@@ -65,73 +166,141 @@ class YtPlaylistManager(QtCore.QObject):
             self.activeTrack.playlist = None
         playlist.tracks = []
         self.playlistCleared.emit(playlist)
-        self.isDirty = True
+        self.record('clearPlaylist', playlist)
 
     def removePlaylist(self, name: str):
-        tmp = YtPlaylist(name)
-        if tmp not in self.playlists:
+        pl = self.playlistIndex.pop(name, None)
+        if pl == None:
             return
-        index = self.playlists.index(tmp)
-        pl = self.playlists[index]
-        del(self.playlists[index])
+        self.playlists.remove(pl)
         self.playlistRemoved.emit(pl)
-        self.isDirty = True
+        self.record('removePlaylist', pl)
 
     def setPlaylists(self, playlists: list):
         self.playlists = playlists
+        self.playlistIndex = { pl.name: pl for pl in playlists }
 
     def loadPlaylists(self):
-        pl = {}
+        pl = []
         try:
-            with open(self.playlistPath, 'r+') as fp:
-                pl = json.load(fp)
-        except FileNotFoundError:
-            return
+            pl = self.playlistStore.load()
         except Exception as e:
             print(f'Could not load playlists: {e}')
             print(f'As a safeguard, I am refusing to start. Fix or delete your playlist.')
             quit()
 
-        self.playlists = []
-        for name in pl:
-            playlist = YtPlaylist(name)
-            for track in pl[name]:
-                # Avoid passing title multiple times.
-                tags = {tag: track[tag] for tag in track if tag != 'title'}
-                ytTrack = YtTrack(track['title'], playlist, **tags)
-                playlist.tracks.append(ytTrack)
-            self.playlists.append(playlist)
-
-    def savePlaylists(self):
-        playlists = { pl.name: [t.getTags() for t in pl] for pl in self.playlists }
-        serialized = json.dumps(playlists)
-        with open(self.playlistPath, 'w+') as fp:
-            fp.write(serialized)
-        self.isDirty = False
+        # Tracks are only created once a playlist is first used.
+        self.setPlaylists([
+            YtPlaylist(name, loader = loader, count = count)
+            for (name, count, loader) in pl ])
+
+    def savePlaylists(self, force: bool = False):
+        """
+        Writes changes recorded since the last save. Forcing also writes what is
+        otherwise only written now and then, such as the library index.
+        This runs on the thread of the scheduler, except for tools run without it.
+        """
+        self.playlistStore.flush()
+        self.history.flush()
+        self.playLog.flush(force = force)
+        self.libraryIndex.save(force = force)
+
+    def loadHistory(self):
+        """
+        The history is shown as a playlist, but kept apart from the others, see
+        YtHistory. It used to be a playlist like any other, and moves out once.
+        """
+        tracks = self.history.load()
+        stored = self.getPlaylist(self.historyName)
+        if stored != None:
+            tracks = ([t.getTags() for t in stored.tracks] + tracks)[-YtHistory.capacity:]
+            self.history.replace(tracks)
+            self.playlistStore.record('removePlaylist', self.historyName)
+            self.libraryIndex.record('removePlaylist', self.historyName)
+            self.setDirty()
+        self.libraryIndex.exclude(self.historyName)
+        if stored == None and len(tracks) == 0:
+            # It is created with the first track played.
+            return
+        playlist = YtPlaylist(self.historyName, loader = lambda: tracks, count = len(tracks))
+        playlists = list(self.playlists)
+        if stored != None:
+            playlists[playlists.index(stored)] = playlist
+        else:
+            playlists.append(playlist)
+        self.setPlaylists(playlists)
+
+    def recordPlay(self, track: YtTrack, start: float, seconds: float, end):
+        """ Takes note of a track having been played, see YtPlayLog. """
+        self.playLog.recordPlay(track, start, seconds, end)
+        self.setDirty()
+
+    def addToHistory(self, track: YtTrack):
+        self.addTracks(self.historyName, [track])
+        playlist = self.getPlaylist(self.historyName)
+        if len(playlist) <= YtHistory.capacity:
+            return
+        # The oldest tracks drop out, which the log of the history takes care of.
+        oldest = playlist.tracks[:len(playlist) - YtHistory.capacity]
+        playlist.removeTracks(oldest)
+        for track in oldest:
+            if self.activeTrack == track:
+                self.activeTrack.playlist = None
+            track.playlist = None
+        self.tracksRemoved.emit(playlist, oldest)
+
+    def loadShuffles(self):
+        try:
+            with open(self.shufflePath) as fp:
+                self.shuffleStates = json.load(fp)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f'Could not load shuffle orders: {e}')
+            return
+        for (name, state) in self.shuffleStates.items():
+            playlist = self.getPlaylist(name)
+            if playlist != None:
+                playlist.restoreShuffle(state)
+
+    def saveShuffles(self):
+        """
+        Shuffle orders change on this thread, so they are copied here, and only
+        the copies are written on the thread of the scheduler.
+        """
+        changed = False
+        for playlist in self.playlists:
+            state = playlist.shuffleState()
+            if state != None:
+                self.shuffleStates[playlist.name] = state
+                changed = True
+        if not changed:
+            return
+        # Playlists removed since are left out.
+        states = { name: s for (name, s) in self.shuffleStates.items() if name in self.playlistIndex }
+        self.scheduler.schedule('shuffles',
+            lambda: YtPlaylistJournal.writeAtomically(self.shufflePath, json.dumps(states).encode()))
 
     # This must be called every time a track's index in a playlist changes,
     # because the current track is identified by playlist name and index.
     def savePlayingTrack(self):
-        '''Saves the currently playing track.'''
-        fd = open(self.currentTrackPath, 'w+')
-        if self.activeTrack == None:
-            fd.truncate()
-            fd.close()
-            return
-        playlistName = None
-        trackIndex = None
-        playlist = self.activeTrack.playlist
-        if playlist != None:
-            playlistName = playlist.name
-            trackIndex = playlist.trackIndex(self.activeTrack)
-        playingTrack = {
-            'playlist': playlistName,
-            'trackIndex': trackIndex,
-            'tags': self.activeTrack.getTags()
-        }
-        serialized = json.dumps(playingTrack)
-        fd.write(serialized)
-        fd.close()
+        '''Saves the currently playing track, as it is now, but later.'''
+        data = b''
+        if self.activeTrack != None:
+            playlistName = None
+            trackIndex = None
+            playlist = self.activeTrack.playlist
+            if playlist != None:
+                playlistName = playlist.name
+                trackIndex = playlist.trackIndex(self.activeTrack)
+            playingTrack = {
+                'playlist': playlistName,
+                'trackIndex': trackIndex,
+                'tags': self.activeTrack.getTags()
+            }
+            data = json.dumps(playingTrack).encode()
+        self.scheduler.schedule('playingTrack',
+            lambda: YtPlaylistJournal.writeAtomically(self.currentTrackPath, data))
 
     def loadPlayingTrack(self) -> YtTrack:
         '''Returns the last track that was playing when the player was last running.'''
@@ -146,9 +315,8 @@ class YtPlaylistManager(QtCore.QObject):
         playlistName = savedTrack['playlist']
         if playlistName == None:
             tags = savedTrack['tags']
-            track = YtTrack(tags['title'])
-            track._tags = tags
-            return track
+            title = tags.pop('title')
+            return YtTrack(title, **tags)
         playlist = self.getPlaylist(playlistName)
         return playlist[savedTrack['trackIndex']]
 
@@ -156,36 +324,28 @@ class YtPlaylistManager(QtCore.QObject):
         return self.playlists
 
     def getPlaylist(self, name: str) -> YtPlaylist:
-        for pl in self.playlists:
-            if pl.name == name:
-                return pl
-        return None
+        return self.playlistIndex.get(name)
 
     def createPlaylist(self, plName: str) -> YtPlaylist:
-        for playlist in self.playlists:
-            if playlist.name == plName:
-                return None
+        if plName in self.playlistIndex:
+            return None
         playlist = YtPlaylist(plName)
         self.playlists.append(playlist)
+        self.playlistIndex[plName] = playlist
         self.playlistCreated.emit(playlist)
-        self.isDirty = True
+        self.record('createPlaylist', playlist)
         return playlist
 
     def playlistByName(self, plName: str) -> YtPlaylist:
-        for pl in self.playlists:
-            if pl.name == plName:
-                return pl
-        return None
+        return self.playlistIndex.get(plName)
 
     def addTracks(self, plName: str, tracks: list):
         playlist = self.playlistByName(plName)
         if playlist == None:
             playlist = self.createPlaylist(plName)
-        playlist.tracks.extend(tracks)
-        for track in tracks:
-            track.playlist = playlist
+        playlist.extend(tracks)
         self.tracksAdded.emit(playlist, tracks)
-        self.isDirty = True
+        self.record('addTracks', playlist, tracks = [t.getTags() for t in tracks])
         self.savePlayingTrack()
 
     def removeTracks(self, playlist: YtPlaylist, tracks: list):
@@ -193,20 +353,31 @@ class YtPlaylistManager(QtCore.QObject):
             return
         saveTrack = (self.activeTrack != None and 
                      playlist == self.activeTrack.playlist)
+        indexes = playlist.removeTracks(tracks)
         for track in tracks:
             if self.activeTrack == track:
                 self.activeTrack.playlist = None
             track.playlist = None
-            del(playlist[track])
         self.tracksRemoved.emit(playlist, tracks)
-        self.isDirty = True
+        self.record('removeTracks', playlist, indexes = indexes)
         if saveTrack:
             self.savePlayingTrack()
 
+    def sortPlaylist(self, playlist: YtPlaylist, key: typing.Callable, reverse: bool = False):
+        tracks = playlist.tracks
+        order = sorted(range(len(tracks)), key = lambda i: key(tracks[i]), reverse = reverse)
+        self.orderPlaylist(playlist, order)
+
+    def orderPlaylist(self, playlist: YtPlaylist, order: list):
+        """ Rearranges tracks so that the track at index order[i] ends up at index i. """
+        playlist.reorder(order)
+        self.record('orderTracks', playlist, indexes = [int(i) for i in order])
+        self.savePlayingTrack()
+
     def activateTrack(self, track: YtTrack):
         self.activeTrack = track
         self.trackActivated.emit(track)
-        self.addTracks('# History', [track.makeCopy()])
+        self.addToHistory(track.makeCopy())
         self.savePlayingTrack()
 
     def activateNextTrack(self, loopOther: bool = False):
@@ -226,11 +397,8 @@ class YtPlaylistManager(QtCore.QObject):
         playlist = self.activeTrack.playlist
         trackIndex = playlist.trackIndex(self.activeTrack)
         
-        if self.playMode == YtPlayMode.Shuffle:
-            index = numpy.random.choice([
-                i for i in range(len(playlist.tracks)) 
-                if i != trackIndex])
-            nextTrack = playlist[index]
+        if self.playMode == YtPlayMode.Shuffle or self.playMode == YtPlayMode.Weighted:
+            nextTrack = self.nextShuffledTrack(playlist, trackIndex, direction)
         # Skip to the next track even in loop mode if manually invoked.
         elif self.playMode == YtPlayMode.Normal or loopOther:
             nextTrack = playlist[trackIndex + direction]
@@ -240,6 +408,39 @@ class YtPlaylistManager(QtCore.QObject):
 
         self.activateTrack(nextTrack)
 
+    def nextShuffledTrack(self, playlist: YtPlaylist, trackIndex: int, direction: int) -> YtTrack:
+        shuffle = playlist.shuffle()
+        if self.playMode == YtPlayMode.Weighted:
+            shuffle.selectWeighted(trackIndex)
+            index = shuffle.nextWeighted(playlist.tracks) if direction > 0 else shuffle.previousWeighted()
+        else:
+            shuffle.select(trackIndex)
+            index = shuffle.next() if direction > 0 else shuffle.previous()
+        if index == None:
+            # Nothing to go back to, so start over instead.
+            self.activeTrack.position = 0
+            return self.activeTrack
+        return playlist[index]
+
+    def upcomingTracks(self, count: int) -> list:
+        """ Returns the tracks most likely to be played after the active track, in order. """
+        track = self.activeTrack
+        if track == None or track.playlist == None or len(track.playlist) == 0:
+            return []
+        playlist = track.playlist
+        if self.playMode == YtPlayMode.Normal:
+            index = playlist.trackIndex(track)
+            return [playlist[index + i] for i in range(1, min(count, len(playlist) - 1) + 1)]
+        if self.playMode == YtPlayMode.Shuffle:
+            shuffle = playlist.shuffle()
+            shuffle.select(playlist.trackIndex(track))
+            return [playlist[i] for i in shuffle.peek(count)]
+        if self.playMode == YtPlayMode.Weighted:
+            shuffle = playlist.shuffle()
+            shuffle.selectWeighted(playlist.trackIndex(track))
+            return [playlist[i] for i in shuffle.peekWeighted(playlist.tracks, count)]
+        return []
+
     def removeDuplicates(self, playlist: YtPlaylist, tracks: list):
         # Be careful which tracks to view as duplicates. Two tracks might
         # have the same titles, but if one has a video ID and was renamed
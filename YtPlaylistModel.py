@@ -1,3 +1,4 @@
+import datetime
 from PyQt6 import QtCore, QtGui
 from YtPlaylist import YtPlaylist
 from YtPlaylistManager import YtPlaylistManager
@@ -40,6 +41,16 @@ class YtPlaylistModel(QtCore.QAbstractListModel):
             label = f'{playlist.name} ({len(playlist)})'
             return label
         
+        if role == QtCore.Qt.ItemDataRole.ToolTipRole:
+            # Do not load playlists just for showing a tooltip.
+            playlist = self.getPlaylist(index)
+            if not playlist.isLoaded():
+                return None
+            columns = playlist.columns()
+            duration = datetime.timedelta(seconds = columns.total('duration'))
+            playTime = datetime.timedelta(seconds = columns.total('playTime'))
+            return f'Duration: {duration}\nPlay Time: {playTime}'
+
         if role == QtCore.Qt.ItemDataRole.FontRole:
             track = self.playlistManager.getActiveTrack()
             playlist = self.getPlaylist(index)
@@ -0,0 +1,28 @@
+from PyQt6 import QtCore
+
+from YtPlaylistManager import YtPlaylistManager
+from YtResolver import YtResolver
+from YtTrack import YtTrack
+
+class YtPrefetcher(QtCore.QObject):
+    """
+    Prepares the tracks most likely to be played next while the current track
+    is playing, so that the next track starts right away instead of waiting on
+    a search for its video first. Those are the next tracks in the playlist, or
+    the tracks drawn ahead of time in shuffle mode.
+    """
+    def __init__(self, playlistManager: YtPlaylistManager, resolver: YtResolver, count: int = 3):
+        super().__init__()
+        self.playlistManager = playlistManager
+        self.resolver = resolver
+        self.count = count
+        self.playlistManager.trackActivated.connect(self.prefetch)
+        self.playlistManager.playModeChanged.connect(self.prefetch)
+
+    def prefetch(self):
+        tracks = self.playlistManager.upcomingTracks(self.count)
+        tracks = [t for t in tracks if YtPrefetcher.needsPrefetching(t)]
+        self.resolver.resolve(tracks, reportErrors = False, showProgress = False)
+
+    def needsPrefetching(track: YtTrack) -> bool:
+        return YtResolver.needsResolving(track) or not track.hasIcon()
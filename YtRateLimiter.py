@@ -0,0 +1,28 @@
+import threading
+import time
+
+class YtRateLimiter:
+    """
+    Limits how often something happens, across all threads, to a rate per second.
+    Up to burst times can happen right away after a pause, which is then made up
+    for by waiting for the time they would have taken at that rate.
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """ Waits until the rate allows for one more time. """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,211 @@
+from PyQt6 import QtCore
+
+from YtExtractor import YtExtractor
+from YtMetadataCache import YtMetadataCache
+from YtPlaylistManager import YtPlaylistManager
+from YtSafeSignal import YtSafeSignal
+from YtThumbnailWorker import YtThumbnailWorker
+from YtTrack import YtTrack
+from YtTrackInfoSignals import YtTrackInfoSignals
+
+class YtResolverWorker(QtCore.QRunnable):
+    def __init__(self, resolver, jobs: list, refresh: bool, urgent: bool):
+        super().__init__()
+        self.resolver = resolver
+        self.jobs = jobs
+        self.refresh = refresh
+        self.urgent = urgent
+
+    def run(self):
+        tracks = [job['tracks'][0] for job in self.jobs]
+        try:
+            results = YtResolver.lookup(tracks, self.refresh, self.urgent)
+        except Exception as e:
+            # Every job has to be resolved, or it would wait forever.
+            results = [(None, f'Unable to retrieve track information:\n{e}')] * len(self.jobs)
+        for (job, result) in zip(self.jobs, results):
+            YtSafeSignal.emit(self.resolver.jobResolved, job, result)
+
+class YtResolver(QtCore.QObject):
+    """
+    Resolves tracks to videos, i.e. finds their video ID, duration, channel and
+    thumbnail, in the background. Tracks for the same video ID, or with the
+    same title if they have none, are only looked up once, also when they are
+    asked for again while being looked up. Lookups are done in batches on a
+    thread pool of their own, so that resolving thousands of tracks never keeps
+    more than a few batches waiting on youtube-dl at the same time.
+    """
+    progressChanged = QtCore.pyqtSignal(int, int)
+    resolveError = QtCore.pyqtSignal(str)
+    jobResolved = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, playlistManager: YtPlaylistManager, threadCount: int = 2, batchSize: int = 8):
+        super().__init__()
+        self.playlistManager = playlistManager
+        self.batchSize = batchSize
+        self.threadPool = QtCore.QThreadPool()
+        self.threadPool.setMaxThreadCount(threadCount)
+        # Jobs by key, for as long as they are being looked up.
+        self.jobs = {}
+        self.total = 0
+        self.done = 0
+        self.errors = []
+        self.thumbnailSignals = YtTrackInfoSignals()
+        self.thumbnailSignals.trackUpdated.connect(self.playlistManager.updateTrack)
+        self.jobResolved.connect(self.applyResult)
+
+    def lookup(tracks: list, refresh: bool = False, urgent: bool = False) -> list:
+        """
+        Returns a tuple of information and error message for each track, one of
+        which is None. Information is taken from the cache unless refreshing.
+        All other tracks are passed to youtube-dl at once.
+        """
+        results = [None] * len(tracks)
+        futures = []
+        for (i, track) in enumerate(tracks):
+            if track.videoId:
+                cached = None if refresh else YtMetadataCache.lookupVideo(track.videoId)
+                query = track.videoId
+            else:
+                cached = None if refresh else YtMetadataCache.lookupSearch(track.title)
+                query = f'ytsearch1:{YtMetadataCache.normalizeTerm(track.title)}'
+            if cached != None:
+                results[i] = cached
+            else:
+                futures.append((i, track, query, YtExtractor.submit(query, urgent)))
+
+        for (i, track, query, future) in futures:
+            try:
+                entries = future.result()
+                if len(entries) == 0:
+                    errors = 'Did not find any matching tracks.'
+                else:
+                    info = YtMetadataCache.parseInfo(entries[0])
+                    errors = None
+            except Exception as e:
+                # When the channel of a video has been deleted, for example, youtube-dl will not
+                # return any information. Its error message is more useful to the user than most.
+                errors = f'Unable to retrieve track information:\n{e}'
+
+            if errors == None:
+                term = None if track.videoId else track.title
+                YtMetadataCache.storeInfo(info, term = term)
+                results[i] = (info, None)
+                continue
+            if YtMetadataCache.isTransient(errors):
+                pass
+            elif track.videoId:
+                YtMetadataCache.storeFailure(errors, videoId = track.videoId)
+            else:
+                YtMetadataCache.storeFailure(errors, term = track.title)
+            results[i] = (None, f'{errors}\n\nCommand:\n{YtExtractor.command(query)}')
+        return results
+
+    def iconUrl(info: dict, largest: bool) -> str:
+        if largest:
+            # Find the largest thumbnail. Thumbnails without resolution information
+            # refer to non-existent thumbnails sometimes and then yield a HTTP 404.
+            selector = lambda t: \
+                t['width'] * t['height'] \
+                if 'width' in t and 'height' in t \
+                else 0
+            sv = sorted(info['thumbnails'], key=selector)
+            return sv[-1]['url']
+        # Retrieve low quality icons unless we are doing an explicit refresh.
+        # This will cause first plays of a track to be faster.
+        return info['thumbnails'][0]['url']
+
+    def applyInfo(track: YtTrack, info: dict, refreshTitle: bool = False):
+        track.duration = info['duration']
+        track.videoId = info['id']
+        track.channel = info['uploader']
+        if refreshTitle:
+            track.title = info['title']
+
+    def needsResolving(track: YtTrack) -> bool:
+        return None in [ track.duration, track.channel, track.videoId ]
+
+    def resolve(self, tracks: list, refreshTitle: bool = False, refreshThumbnail: bool = False,
+    reportErrors: bool = True, showProgress: bool = True, urgent: bool = False):
+        added = []
+        # Jobs already waiting in a batch that are now asked for urgently.
+        hurried = []
+        counted = 0
+        for track in tracks:
+            lookup = track.videoId if track.videoId else f't:{YtMetadataCache.normalizeTerm(track.title)}'
+            key = (lookup, refreshTitle, refreshThumbnail)
+            job = self.jobs.get(key)
+            if job != None:
+                job['tracks'].append(track)
+                job['reportErrors'] = job['reportErrors'] or reportErrors
+                if showProgress and not job['showProgress']:
+                    job['showProgress'] = True
+                    counted += 1
+                if urgent and not job['urgent']:
+                    # Its batch may not even have started, so it is looked up
+                    # again on its own. Whichever lookup ends first is used.
+                    job['urgent'] = True
+                    hurried.append(job)
+                continue
+            job = {
+                'key': key,
+                'tracks': [track],
+                'refreshTitle': refreshTitle,
+                'refreshThumbnail': refreshThumbnail,
+                'reportErrors': reportErrors,
+                'showProgress': showProgress,
+                'urgent': urgent,
+            }
+            self.jobs[key] = job
+            added.append(job)
+        if showProgress:
+            counted += len(added)
+        self.total += counted
+        # Refreshing information on request should retrieve it again.
+        refresh = refreshTitle
+        for (jobs, urgent) in ((added, urgent), (hurried, True)):
+            priority = 1 if urgent else 0
+            for i in range(0, len(jobs), self.batchSize):
+                worker = YtResolverWorker(self, jobs[i:i + self.batchSize], refresh, urgent)
+                self.threadPool.start(worker, priority)
+        if counted > 0:
+            self.progressChanged.emit(self.done, self.total)
+
+    def resolvePlaylist(self, tracks: list):
+        """ Resolves all tracks not resolved yet, quietly, so that they can be played right away later. """
+        self.resolve([t for t in tracks if YtResolver.needsResolving(t)], reportErrors = False)
+
+    def applyResult(self, job: dict, result: tuple):
+        if self.jobs.get(job['key']) is not job:
+            # It was looked up twice, and the other lookup ended first.
+            return
+        del(self.jobs[job['key']])
+        info, errors = result
+        if info == None:
+            if job['reportErrors']:
+                self.errors.append(errors)
+        else:
+            tracks = job['tracks']
+            for track in tracks:
+                YtResolver.applyInfo(track, info, job['refreshTitle'])
+                self.playlistManager.updateTrack(track)
+            if job['refreshThumbnail'] or not tracks[0].hasIcon():
+                iconUrl = YtResolver.iconUrl(info, job['refreshThumbnail'])
+                worker = YtThumbnailWorker(iconUrl, tracks[0], self.thumbnailSignals)
+                self.threadPool.start(worker)
+        if not job['showProgress']:
+            return
+        self.done += 1
+        self.progressChanged.emit(self.done, self.total)
+        if self.done == self.total:
+            self.finish()
+
+    def finish(self):
+        errors = self.errors
+        self.total = 0
+        self.done = 0
+        self.errors = []
+        if len(errors) == 1:
+            self.resolveError.emit(errors[0])
+        elif len(errors) > 1:
+            self.resolveError.emit(f'Could not retrieve information for {len(errors)} tracks:\n\n{errors[0]}')
@@ -2,6 +2,7 @@ import abc
 from PyQt6 import QtCore
 
 from YtSafeSignal import YtSafeSignal
+from YtTrackKey import YtTrackKey
 
 class YtSearchSignals(QtCore.QObject):
     tracksFound = QtCore.pyqtSignal(list)
@@ -19,6 +20,8 @@ class YtSearchWorker(QtCore.QRunnable):
         self.tracksFound = self.signals.tracksFound
         self.searchFinished = self.signals.searchFinished
         self.searchError = self.signals.searchError
+        # Keys of the tracks found so far.
+        self.seenTracks = set()
 
     def run(self):
         try:
@@ -28,6 +31,16 @@ class YtSearchWorker(QtCore.QRunnable):
         finally:
             YtSafeSignal.emit(self.searchFinished, self)
 
+    def newTracks(self, tracks: list) -> list:
+        """ Returns the tracks not found before, and remembers them as found. """
+        newTracks = []
+        for track in tracks:
+            key = YtTrackKey.of(track)
+            if key not in self.seenTracks:
+                self.seenTracks.add(key)
+                newTracks.append(track)
+        return newTracks
+
     @abc.abstractmethod
     def search(self):
         raise NotImplementedError()
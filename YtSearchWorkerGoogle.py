@@ -1,6 +1,6 @@
 import html
-import requests
 
+from YtHttp import YtHttp
 from YtSafeSignal import YtSafeSignal
 from YtSearchWorker import YtSearchWorker
 from YtTrack import YtTrack
@@ -33,8 +33,7 @@ class YtSearchWorkerGoogle(YtSearchWorker):
         for _ in range(keyCount):
             key = self.apiKeys[self.currentKey]
             params['key'] = key
-            response = requests.get(url, params)
-            parsed = response.json()
+            parsed = YtHttp.getJson(url, params)
             if 'error' in parsed:
                 self.currentKey = (self.currentKey + 1) % keyCount
             else:
@@ -56,5 +55,5 @@ class YtSearchWorkerGoogle(YtSearchWorker):
             track = YtTrack(title, **tags)
             tracks.append(track)
 
-        YtSafeSignal.emit(self.tracksFound, tracks)
+        YtSafeSignal.emit(self.tracksFound, self.newTracks(tracks))
 
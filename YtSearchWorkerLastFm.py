@@ -1,19 +1,49 @@
-import requests
+import concurrent.futures
+import pathlib
 import urllib
 
+from YtHttp import YtHttp
+from YtRateLimiter import YtRateLimiter
 from YtSafeSignal import YtSafeSignal
 from YtSearchWorker import YtSearchWorker
 from YtTrack import YtTrack
 
 class YtSearchWorkerLastFm(YtSearchWorker):
+    """
+    Searches Last.fm for albums matching a term and then for the tracks of those
+    albums and the top tracks of their artists. Those lookups are many, so they
+    are made a few at a time in parallel, each artist only once, and tracks are
+    passed on in the order lookups finish. All searches share a limit on the
+    requests per second, as asked for by Last.fm. The limit can be changed by
+    writing a number of requests per second into the file "lastfm_rate".
+    """
+    ratePath = pathlib.Path(pathlib.Path.home(), '.qtube/lastfm_rate')
+    rateLimiter = YtRateLimiter(5, burst = 5)
+    fetchCount = 8
+
     def __init__(self, term, apiKey, trackLimit=350, relatedTrack=None):
         super().__init__()
         self.term = term
         self.apiKey = apiKey
-        self.seenTracks = []
         self.relatedTrack = relatedTrack
         self.trackLimit = trackLimit
 
+    def loadRateLimit():
+        try:
+            with open(YtSearchWorkerLastFm.ratePath) as fp:
+                rate = float(fp.read().strip())
+            if rate <= 0:
+                raise ValueError(f'{rate} is not a number of requests per second')
+            YtSearchWorkerLastFm.rateLimiter = YtRateLimiter(rate, burst = max(1, int(rate)))
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f'Could not read Last.fm rate limit: {e}')
+
+    def fetch(url: str) -> dict:
+        YtSearchWorkerLastFm.rateLimiter.acquire()
+        return YtHttp.getJson(url)
+
     def search(self):
         if self.relatedTrack != None:
             self.searchSimilar()
@@ -33,8 +63,7 @@ class YtSearchWorkerLastFm(YtSearchWorker):
         # Is this really better? Instead of dealing with array indices, we now
         # need to call "hasattr" to check for existence of a field. We might be
         # wasting CPU time without benefit to code cleanliness.
-        response = requests.get(url)
-        parsed = response.json()
+        parsed = YtSearchWorkerLastFm.fetch(url)
         if 'similartracks' not in parsed:
             return
         ytTracks = []
@@ -44,37 +73,82 @@ class YtSearchWorkerLastFm(YtSearchWorker):
             track = t['name']
             ytTrack = YtTrack(f'{artist} - {track}', artist=artist, track=track, duration=duration)
             ytTracks.append(ytTrack)
-        YtSafeSignal.emit(self.tracksFound, ytTracks)
+        YtSafeSignal.emit(self.tracksFound, self.newTracks(ytTracks))
 
-    def searchTerm(self):
-        page = 0
-        while True:
-            page = page + 1
-            term = urllib.parse.quote(self.term)
-            url = f'http://ws.audioscrobbler.com/2.0/?method=album.search&page={page}&album={term}&api_key={self.apiKey}&format=json'
-            response = requests.get(url).json()
-            try:
-                albums = response['results']['albummatches']['album']
-            except KeyError:
-                return
-            if len(albums) == 0:
-                break
-            for album in albums:
-                artistName = album['artist']
-                albumName = album['name']
-                self.searchAlbumTracks(artistName, albumName)
-                self.searchArtistTracks(artistName)
-                if len(self.seenTracks) > self.trackLimit:
-                    return
+    def albumSearchUrl(self, page: int) -> str:
+        term = urllib.parse.quote(self.term)
+        return f'http://ws.audioscrobbler.com/2.0/?method=album.search&page={page}&album={term}&api_key={self.apiKey}&format=json'
 
-    def searchAlbumTracks(self, artist: str, album: str):
+    def albumUrl(self, artist: str, album: str) -> str:
         q_artist = urllib.parse.quote(artist)
         q_album = urllib.parse.quote(album)
-        url = f'http://ws.audioscrobbler.com/2.0/?method=album.getinfo&api_key={self.apiKey}&artist={q_artist}&album={q_album}&format=json'
-        try: response = requests.get(url).json()
-        except: return
+        return f'http://ws.audioscrobbler.com/2.0/?method=album.getinfo&api_key={self.apiKey}&artist={q_artist}&album={q_album}&format=json'
+
+    def artistUrl(self, artist: str) -> str:
+        artist = urllib.parse.quote(artist)
+        return f'http://ws.audioscrobbler.com/2.0/?method=artist.getTopTracks&artist={artist}&api_key={self.apiKey}&format=json'
+
+    def searchTerm(self):
+        """
+        Album pages are looked up one after another, each once the lookups for the
+        albums of the one before are done and have not found enough tracks yet.
+        """
+        seenArtists = set()
+        # Handler and its arguments by lookup.
+        pending = {}
+        # Lookups of single albums or artists that failed, which the others make up for.
+        failures = 0
+        with concurrent.futures.ThreadPoolExecutor(YtSearchWorkerLastFm.fetchCount) as executor:
+            def submit(url: str, handler, *args):
+                pending[executor.submit(YtSearchWorkerLastFm.fetch, url)] = (handler, args)
+
+            page = 1
+            submit(self.albumSearchUrl(page), None)
+            while len(pending) > 0:
+                done, _ = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    handler, args = pending.pop(future)
+                    if len(self.seenTracks) > self.trackLimit:
+                        break
+                    try:
+                        response = future.result()
+                    except Exception:
+                        if handler == None:
+                            # Without a page of albums there is nothing to go on.
+                            for other in pending:
+                                other.cancel()
+                            raise
+                        failures += 1
+                        continue
+                    if handler != None:
+                        handler(response, *args)
+                        continue
+                    # Without a handler, this is a page of albums.
+                    try:
+                        albums = response['results']['albummatches']['album']
+                    except (KeyError, TypeError):
+                        albums = []
+                    page = page + 1 if len(albums) > 0 else None
+                    for album in albums:
+                        artistName = album['artist']
+                        albumName = album['name']
+                        submit(self.albumUrl(artistName, albumName), self.searchAlbumTracks, albumName)
+                        if artistName not in seenArtists:
+                            seenArtists.add(artistName)
+                            submit(self.artistUrl(artistName), self.searchArtistTracks)
+
+                if len(self.seenTracks) > self.trackLimit:
+                    for future in pending:
+                        future.cancel()
+                    break
+                if len(pending) == 0 and page != None:
+                    submit(self.albumSearchUrl(page), None)
+        if failures > 0:
+            print(f'Could not look up {failures} Last.fm albums or artists')
+
+    def searchAlbumTracks(self, response: dict, album: str):
         try: tracks = response['album']['tracks']['track']
-        except KeyError: return
+        except (KeyError, TypeError): return
         artist = response['album']['artist']
         ytTracks = []
         for t in tracks:
@@ -86,23 +160,16 @@ class YtSearchWorkerLastFm(YtSearchWorker):
                 continue
             title = f'{artist} - {album} - {track}'
             ytTrack = YtTrack(title, artist=artist, album=album, track=track)
-            if ytTrack.title not in self.seenTracks:
-                self.seenTracks.append(ytTrack.title)
+            if len(self.newTracks([ytTrack])) > 0:
+                ytTracks.append(ytTrack)
                 if len(self.seenTracks) > self.trackLimit:
-                    ytTracks.append(ytTrack)
                     break
         YtSafeSignal.emit(self.tracksFound, ytTracks)
-            
-    def searchArtistTracks(self, artist: str):
-        artist = urllib.parse.quote(artist)
-        url = f'http://ws.audioscrobbler.com/2.0/?method=artist.getTopTracks&artist={artist}&api_key={self.apiKey}&format=json'
-        try:
-            response = requests.get(url).json()
-        except:
-            return
+
+    def searchArtistTracks(self, response: dict):
         try:
             tracks = response['toptracks']['track']
-        except KeyError:
+        except (KeyError, TypeError):
             return
         ytTracks = []
         for t in tracks:
@@ -112,19 +179,16 @@ class YtSearchWorkerLastFm(YtSearchWorker):
             except KeyError:
                 continue
             if 'album' in t:
-                album = t['album']                
+                album = t['album']
                 title = f'{artist} - {album} - {track}'
                 ytTrack = YtTrack(title, artist=artist, album=album, track=track)
             else:
                 title = f'{artist} - {track}'
                 ytTrack = YtTrack(title, artist=artist, track=track)
 
-            if ytTrack.title not in self.seenTracks:
-                self.seenTracks.append(ytTrack.title)
+            if len(self.newTracks([ytTrack])) > 0:
                 ytTracks.append(ytTrack)
                 if len(self.seenTracks) > self.trackLimit:
                     break
 
         YtSafeSignal.emit(self.tracksFound, ytTracks)
-
-
@@ -0,0 +1,21 @@
+from YtLibraryIndex import YtLibraryIndex
+from YtPlaylistManager import YtPlaylistManager
+from YtSafeSignal import YtSafeSignal
+from YtSearchWorker import YtSearchWorker
+from YtTrack import YtTrack
+
+class YtSearchWorkerLibrary(YtSearchWorker):
+    def __init__(self, playlistManager: YtPlaylistManager, term: str):
+        super().__init__()
+        self.libraryIndex: YtLibraryIndex = playlistManager.libraryIndex
+        self.term = term
+        # Playlists can only be looked at on the GUI thread, should the
+        # index have to be created from them.
+        self.libraryIndex.provideSnapshot(playlistManager.playlistSnapshot())
+
+    def search(self):
+        tracks = []
+        for tags in self.libraryIndex.search(self.term):
+            title = tags.pop('title')
+            tracks.append(YtTrack(title, **tags))
+        YtSafeSignal.emit(self.tracksFound, tracks)
@@ -0,0 +1,264 @@
+from array import array
+import bisect
+import math
+import random
+
+class YtFenwickTree:
+    """
+    Weights by index along with sums of ranges of them, so that changing a weight
+    and finding the index a running total of weights reaches both take O(log n).
+    """
+    def __init__(self, weights: list):
+        self.weights = array('d', weights)
+        # Node i holds the sum of the weights in (i - lowbit(i), i], starting at 1.
+        self.tree = array('d', [0.0]) * (len(weights) + 1)
+        for i in range(1, len(self.tree)):
+            self.tree[i] += self.weights[i - 1]
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.weights)
+
+    def append(self, weight: float):
+        i = len(self.tree)
+        self.weights.append(weight)
+        # The nodes below the new one are all there already.
+        total = weight
+        step = 1
+        while step < (i & -i):
+            total += self.tree[i - step]
+            step <<= 1
+        self.tree.append(total)
+
+    def update(self, index: int, weight: float):
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self) -> float:
+        total = 0.0
+        i = len(self.weights)
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, value: float) -> int:
+        """ Returns the first index at which the running total of weights exceeds the value. """
+        position = 0
+        step = 1 << (len(self.weights).bit_length() - 1) if len(self.weights) > 0 else 0
+        while step > 0:
+            node = position + step
+            if node < len(self.tree) and self.tree[node] <= value:
+                position = node
+                value -= self.tree[node]
+            step >>= 1
+        return min(position, len(self.weights) - 1)
+
+class YtShuffle:
+    """
+    Order in which to shuffle through the tracks of a playlist, by track index.
+    Every track is played once, in a random order, before any is played again,
+    after which a new order is drawn. This order is kept along with how far it
+    has been played, so that shuffling goes on where it left off after a restart.
+    Next and previous tracks are just a step forward or back in this order.
+    Tracks added are inserted at random into the part not played yet, and tracks
+    removed or moved are taken out or renumbered, without drawing a new order.
+
+    Shuffling can also be weighted, by how long tracks have been played, so that
+    favorites come up more often. Tracks are then drawn one at a time, with a
+    Fenwick tree of the weights, which takes O(log n) per track, and kept in a
+    history of their own for going back.
+    """
+    historyLength = 1000
+
+    def __init__(self, count: int, state: dict = None):
+        self.random = random.Random()
+        if state != None and sorted(state['order']) == list(range(count)) and -1 <= state['position'] < count:
+            self.order = state['order']
+            self.position = state['position']
+        else:
+            self.order = self.permutation(count, None)
+            # Nothing of this order has been played yet.
+            self.position = -1
+        self.positions = self.inverse(self.order)
+        # The order after this one, if tracks were asked for beyond this one.
+        self.nextOrder = None
+        # Weighted shuffling.
+        self.weights = None
+        self.drawn = []
+        self.cursor = -1
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.order)
+
+    def state(self) -> dict:
+        # A copy, as saving happens on another thread.
+        return { 'order': list(self.order), 'position': self.position }
+
+    def permutation(self, count: int, avoid: int) -> list:
+        """ Draws an order of all indexes, not starting with the given one, unless it is the only one. """
+        order = list(range(count))
+        self.random.shuffle(order)
+        if count > 1 and order[0] == avoid:
+            other = self.random.randrange(1, count)
+            order[0], order[other] = order[other], order[0]
+        return order
+
+    def inverse(self, order: list) -> list:
+        positions = [0] * len(order)
+        for (position, index) in enumerate(order):
+            positions[index] = position
+        return positions
+
+    def swap(self, a: int, b: int):
+        order = self.order
+        order[a], order[b] = order[b], order[a]
+        self.positions[order[a]] = a
+        self.positions[order[b]] = b
+
+    def select(self, index: int):
+        """
+        Takes note of a track being played that was not picked by this order, such as
+        one chosen by the user. A track not played yet counts as played from now on.
+        """
+        if index < 0:
+            return
+        position = self.positions[index]
+        if position > self.position:
+            self.swap(self.position + 1, position)
+            self.position += 1
+            self.dirty = True
+
+    def next(self) -> int:
+        if len(self.order) == 0:
+            return None
+        if self.position + 1 == len(self.order):
+            last = self.order[self.position]
+            self.order = self.nextOrder if self.nextOrder != None else self.permutation(len(self.order), last)
+            self.positions = self.inverse(self.order)
+            self.nextOrder = None
+            self.position = -1
+        self.position += 1
+        self.dirty = True
+        return self.order[self.position]
+
+    def previous(self) -> int:
+        """ Returns None once back at the start of this order. """
+        if self.position <= 0:
+            return None
+        self.position -= 1
+        self.dirty = True
+        return self.order[self.position]
+
+    def peek(self, count: int) -> list:
+        """ Returns the indexes coming up next, without moving on. """
+        upcoming = self.order[self.position + 1:self.position + 1 + count]
+        if len(upcoming) < count and len(self.order) > 0:
+            if self.nextOrder == None:
+                self.nextOrder = self.permutation(len(self.order), self.order[-1])
+            upcoming += self.nextOrder[:count - len(upcoming)]
+        return upcoming
+
+    def added(self, tracks: list):
+        for track in tracks:
+            index = len(self.order)
+            self.order.append(index)
+            self.positions.append(index)
+            # Swapping with a random track not played yet is an insertion at random.
+            self.swap(index, self.random.randint(self.position + 1, index))
+            if self.nextOrder != None:
+                self.nextOrder.append(index)
+                other = self.random.randint(0, index)
+                self.nextOrder[index], self.nextOrder[other] = self.nextOrder[other], self.nextOrder[index]
+            if self.weights != None:
+                self.weights.append(YtShuffle.weightOf(track))
+        self.dirty = True
+
+    def removed(self, indexes: list):
+        """ Takes out the tracks at the given indexes, in ascending order, and renumbers the others. """
+        removed = set(indexes)
+        renumber = lambda order: [i - bisect.bisect_left(indexes, i) for i in order if i not in removed]
+        self.position -= sum(1 for i in self.order[:self.position + 1] if i in removed)
+        self.order = renumber(self.order)
+        self.positions = self.inverse(self.order)
+        if self.nextOrder != None:
+            self.nextOrder = renumber(self.nextOrder)
+        self.cursor -= sum(1 for i in self.drawn[:self.cursor + 1] if i in removed)
+        self.drawn = renumber(self.drawn)
+        if self.weights != None:
+            self.weights = YtFenwickTree([w for (i, w) in enumerate(self.weights.weights) if i not in removed])
+        self.dirty = True
+
+    def reordered(self, order: list):
+        """ Renumbers tracks after the track at index order[i] moved to index i. """
+        newIndexes = self.inverse(order)
+        renumber = lambda indexes: [newIndexes[i] for i in indexes]
+        self.order = renumber(self.order)
+        self.positions = self.inverse(self.order)
+        if self.nextOrder != None:
+            self.nextOrder = renumber(self.nextOrder)
+        self.drawn = renumber(self.drawn)
+        if self.weights != None:
+            self.weights = YtFenwickTree([self.weights.weights[i] for i in order])
+        self.dirty = True
+
+    def weightOf(track) -> float:
+        # Each doubling of the minutes played adds about as much again.
+        return 1 + math.log2(1 + track.playTime / 60)
+
+    def weightChanged(self, index: int, track):
+        if self.weights != None:
+            self.weights.update(index, YtShuffle.weightOf(track))
+
+    def draw(self, tracks: list, avoid: int) -> int:
+        if self.weights == None or len(self.weights) != len(tracks):
+            self.weights = YtFenwickTree([YtShuffle.weightOf(t) for t in tracks])
+        total = self.weights.total()
+        # Drawing the same track twice in a row is unlikely, except with heavy weights.
+        for attempt in range(10):
+            index = self.weights.find(self.random.random() * total)
+            if index != avoid:
+                break
+        return index
+
+    def selectWeighted(self, index: int):
+        if index < 0:
+            return
+        if self.cursor >= 0 and self.drawn[self.cursor] == index:
+            return
+        self.drawn.insert(self.cursor + 1, index)
+        self.cursor += 1
+        self.trimHistory()
+
+    def nextWeighted(self, tracks: list) -> int:
+        if len(tracks) == 0:
+            return None
+        self.peekWeighted(tracks, 1)
+        self.cursor += 1
+        self.trimHistory()
+        return self.drawn[self.cursor]
+
+    def previousWeighted(self) -> int:
+        if self.cursor <= 0:
+            return None
+        self.cursor -= 1
+        return self.drawn[self.cursor]
+
+    def peekWeighted(self, tracks: list, count: int) -> list:
+        if len(tracks) == 0:
+            return []
+        while len(self.drawn) < self.cursor + 1 + count:
+            self.drawn.append(self.draw(tracks, self.drawn[-1] if len(self.drawn) > 0 else None))
+        return self.drawn[self.cursor + 1:self.cursor + 1 + count]
+
+    def trimHistory(self):
+        if self.cursor > YtShuffle.historyLength:
+            del(self.drawn[:self.cursor - YtShuffle.historyLength])
+            self.cursor = YtShuffle.historyLength
@@ -0,0 +1,64 @@
+import collections
+import threading
+import weakref
+
+class YtSnapshot:
+    """
+    Tracks of a playlist as they were at one point in time, for saving them on
+    another thread while they keep changing. Taking one costs nothing per track.
+    The playlist shares its list of tracks with the snapshot and only copies it
+    when it changes next. Tracks keep their tags as they were before the first
+    change after a snapshot, for as long as any snapshot that old is around.
+    Snapshots are numbered by epoch, and changes by the epoch they were made in.
+    Iterating a snapshot returns the tags of its tracks at its epoch.
+
+    Snapshots must be taken, and tracks changed, on the GUI thread only.
+    Snapshots can then be read on any thread, without locking.
+    """
+    currentEpoch = 0
+    # Epoch of the oldest snapshot still around, which no change is older than
+    # if there is none.
+    oldestEpoch = 0
+    openEpochs = collections.Counter()
+    lock = threading.Lock()
+    # Tracks keeping tags for snapshots, which may not be needed any more. Tracks
+    # that are gone otherwise are not kept around for this.
+    remembering = weakref.WeakSet()
+
+    def __init__(self, tracks: list):
+        self.tracks = tracks
+        self.epoch = YtSnapshot.open()
+        # Garbage collection may do this on any thread.
+        weakref.finalize(self, YtSnapshot.close, self.epoch)
+
+    def open() -> int:
+        YtSnapshot.forget()
+        epoch = YtSnapshot.currentEpoch
+        with YtSnapshot.lock:
+            YtSnapshot.openEpochs[epoch] += 1
+            YtSnapshot.oldestEpoch = min(YtSnapshot.openEpochs)
+        # Changes from now on belong to the next epoch.
+        YtSnapshot.currentEpoch = epoch + 1
+        return epoch
+
+    def close(epoch: int):
+        with YtSnapshot.lock:
+            YtSnapshot.openEpochs[epoch] -= 1
+            if YtSnapshot.openEpochs[epoch] == 0:
+                del(YtSnapshot.openEpochs[epoch])
+            if len(YtSnapshot.openEpochs) > 0:
+                YtSnapshot.oldestEpoch = min(YtSnapshot.openEpochs)
+            else:
+                YtSnapshot.oldestEpoch = YtSnapshot.currentEpoch
+
+    def forget():
+        """ Drops tags kept for snapshots that are gone by now. """
+        for track in list(YtSnapshot.remembering):
+            if not track.forget():
+                YtSnapshot.remembering.discard(track)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __iter__(self):
+        return (track.tagsAt(self.epoch) for track in self.tracks)
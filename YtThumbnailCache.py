@@ -1,5 +1,30 @@
-from PyQt6 import QtGui
+from PyQt6 import QtCore, QtGui
+import collections
 import pathlib
+import threading
+
+from YtSafeSignal import YtSafeSignal
+from YtThumbnailStore import YtThumbnailStore
+
+class YtThumbnailSignals(QtCore.QObject):
+    imageDecoded = QtCore.pyqtSignal(str, int, QtGui.QImage)
+    thumbnailSaved = QtCore.pyqtSignal(str)
+    thumbnailLoaded = QtCore.pyqtSignal(str)
+
+class YtThumbnailDecoder(QtCore.QRunnable):
+    def __init__(self, videoId: str, size: int):
+        super().__init__()
+        self.videoId = videoId
+        self.size = size
+
+    def run(self):
+        # Unlike pixmaps, images can be created outside the GUI thread.
+        image = YtThumbnailCache.readImage(self.videoId, self.size)
+        try:
+            YtSafeSignal.emit(YtThumbnailCache.signals.imageDecoded, self.videoId, self.size, image)
+        except RuntimeError:
+            # The signals are gone when decoding finishes during shutdown.
+            pass
 
 class YtThumbnailCache:
     """
@@ -8,9 +33,60 @@ class YtThumbnailCache:
     a video's thumbnail should affect all tracks with the same video ID. This
     is meant to be a global singleton: notice that the methods and attributes
     are not per instance and use no self attribute.
+
+    Thumbnails are kept in YtThumbnailStore. Besides the thumbnail as
+    downloaded, smaller copies are kept for each size it is shown at. Those are
+    made when the thumbnail is downloaded, or when first needed for thumbnails
+    kept before, which are read from files of their own and then moved over.
+    Thumbnails are asked for by the size they are shown at and the smallest
+    copy at least that large is used, so that the track view, for instance,
+    never decodes nor scales anything larger than its icons. Sizes are in
+    pixels of the longer side and size 0 stands for the thumbnail itself.
+
+    Views ask for thumbnails with requestThumbnail, which never waits on the
+    disk. Thumbnails not in memory are read and decoded on worker threads,
+    with a placeholder shown meanwhile, and thumbnailLoaded is signalled once
+    they are ready.
+
+    Thumbnails are kept in memory up to a budget of decoded bytes, counted as
+    four bytes per pixel. Beyond that, the thumbnails used the longest time ago
+    are dropped and read from disk again when needed. Thumbnails on screen are
+    pinned by whoever shows them and never dropped.
     """
     thumbnailPath = pathlib.Path(pathlib.Path.home(), '.qtube/thumbnails')
-    iconCache = {}
+    listSize = 72
+    notificationSize = 128
+    albumArtSize = 480
+    sizes = (listSize, notificationSize, albumArtSize)
+    # Budget in megabytes, one number, to override the default.
+    budgetPath = pathlib.Path(pathlib.Path.home(), '.qtube/thumbnail_cache')
+    budget = 64 << 20
+    # Icons by video ID and size.
+    iconCache = collections.OrderedDict()
+    usedBytes = 0
+    # Sets of pinned video IDs by whoever pinned them.
+    pins = {}
+    hits = 0
+    misses = 0
+    evictions = 0
+    # Thumbnails are updated from worker threads.
+    lock = threading.RLock()
+    # Video IDs and sizes being decoded, and video IDs known to have no thumbnail.
+    pending = set()
+    missing = set()
+    placeholder = None
+    decodePool = QtCore.QThreadPool()
+    decodePool.setMaxThreadCount(2)
+    signals = None
+
+    def loadBudget():
+        try:
+            with open(YtThumbnailCache.budgetPath) as fp:
+                YtThumbnailCache.budget = int(float(fp.read().strip()) * (1 << 20))
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f'Could not read thumbnail cache budget: {e}')
 
     def iconSize(icon: QtGui.QIcon):
         if icon == None:
@@ -18,30 +94,223 @@ class YtThumbnailCache:
         size = icon.availableSizes()[-1]
         return size.width() * size.height()
 
-    def updateThumbnail(videoId: str, icon: QtGui.QIcon):
-        if icon == None or videoId == None:
-            return
-        cachedIcon = YtThumbnailCache.getCachedThumbnail(videoId)
-        trackSize = YtThumbnailCache.iconSize(icon)
-        cachedSize = YtThumbnailCache.iconSize(cachedIcon)
-        if trackSize > cachedSize:
-            YtThumbnailCache.iconCache[videoId] = icon
+    def pin(owner: str, videoIds: set):
+        """ Replaces the video IDs pinned by the given owner. """
+        with YtThumbnailCache.lock:
+            YtThumbnailCache.pins[owner] = set(videoIds)
 
-    def getCachedThumbnail(videoId: str) -> QtGui.QIcon:
-        if videoId == None:
+    def isPinned(videoId: str) -> bool:
+        return any(videoId in pinned for pinned in YtThumbnailCache.pins.values())
+
+    def fittingSize(size: int) -> int:
+        """ Returns the smallest size kept that is at least as large as the given one. """
+        if size == 0:
+            return 0
+        for s in YtThumbnailCache.sizes:
+            if s >= size:
+                return s
+        return 0
+
+    def thumbnailFile(videoId: str, size: int = 0) -> pathlib.Path:
+        """ Where thumbnails were kept before YtThumbnailStore, one file each. """
+        if size == 0:
+            return pathlib.Path(YtThumbnailCache.thumbnailPath, videoId)
+        return pathlib.Path(YtThumbnailCache.thumbnailPath, str(size), videoId)
+
+    def saveThumbnail(videoId: str, data: bytes) -> QtGui.QImage:
+        """ Stores a downloaded thumbnail with its smaller copies. Can be called from any thread. """
+        image = QtGui.QImage()
+        if not image.loadFromData(data):
             return None
-        if videoId in YtThumbnailCache.iconCache:
-            return YtThumbnailCache.iconCache[videoId]
+        YtThumbnailStore.add(videoId, 0, data, image.width(), image.height())
+        YtThumbnailCache.saveScaled(videoId, image)
+        return image
+
+    def saveScaled(videoId: str, image: QtGui.QImage):
+        """ Stores the smaller copies of a thumbnail. Can be called from any thread. """
+        for size in YtThumbnailCache.sizes:
+            scaled = image
+            if max(image.width(), image.height()) > size:
+                scaled = image.scaled(size, size,
+                    QtCore.Qt.AspectRatioMode.KeepAspectRatio,
+                    QtCore.Qt.TransformationMode.SmoothTransformation)
+            data = QtCore.QByteArray()
+            buffer = QtCore.QBuffer(data)
+            buffer.open(QtCore.QIODevice.OpenModeFlag.WriteOnly)
+            if scaled.save(buffer, 'JPG', 90):
+                YtThumbnailStore.add(videoId, size, data.data(), scaled.width(), scaled.height())
 
+    def loadImage(image: QtGui.QImage, videoId: str, size: int) -> bool:
+        """ Decodes a thumbnail from the store, or from its own file for thumbnails stored before. """
+        data = YtThumbnailStore.read(videoId, size)
+        if data != None:
+            return image.loadFromData(data)
         try:
-            iconPath = pathlib.Path(YtThumbnailCache.thumbnailPath, videoId)
-            with open(iconPath, 'rb') as fp:
+            with open(YtThumbnailCache.thumbnailFile(videoId, size), 'rb') as fp:
                 data = fp.read()
         except FileNotFoundError:
+            return False
+        if not image.loadFromData(data):
+            return False
+        # Moved into the store, so that it is not read from its own file again.
+        YtThumbnailStore.add(videoId, size, data, image.width(), image.height())
+        return True
+
+    def readImage(videoId: str, size: int = 0) -> QtGui.QImage:
+        """
+        Reads the smallest copy of a thumbnail fitting the given size, which is
+        made first if missing. The image is null if there is no thumbnail.
+        """
+        size = YtThumbnailCache.fittingSize(size)
+        image = QtGui.QImage()
+        if size != 0 and YtThumbnailCache.loadImage(image, videoId, size):
+            return image
+        if not YtThumbnailCache.loadImage(image, videoId, 0):
+            return QtGui.QImage()
+        if size == 0:
+            return image
+        YtThumbnailCache.saveScaled(videoId, image)
+        return image.scaled(size, size,
+            QtCore.Qt.AspectRatioMode.KeepAspectRatio,
+            QtCore.Qt.TransformationMode.SmoothTransformation)
+
+    def compact(videoIds: set) -> tuple:
+        """
+        Drops thumbnails of videos other than the given ones, and the files thumbnails
+        were kept in before, after moving those still needed into the store.
+        """
+        for size in (0,) + YtThumbnailCache.sizes:
+            directory = YtThumbnailCache.thumbnailFile('', size)
+            if not directory.is_dir():
+                continue
+            for path in directory.iterdir():
+                if not path.is_file():
+                    continue
+                if path.name in videoIds and not YtThumbnailStore.contains(path.name, size):
+                    YtThumbnailCache.loadImage(QtGui.QImage(), path.name, size)
+                path.unlink()
+            if size != 0:
+                directory.rmdir()
+        return YtThumbnailStore.compact(videoIds)
+
+    def store(key: tuple, icon: QtGui.QIcon):
+        with YtThumbnailCache.lock:
+            cache = YtThumbnailCache.iconCache
+            if key in cache:
+                YtThumbnailCache.usedBytes -= YtThumbnailCache.iconSize(cache[key]) * 4
+            cache[key] = icon
+            cache.move_to_end(key)
+            YtThumbnailCache.usedBytes += YtThumbnailCache.iconSize(icon) * 4
+            YtThumbnailCache.evict()
+
+    def evict():
+        cache = YtThumbnailCache.iconCache
+        # Pinned thumbnails are moved to the end, so each is skipped once at most.
+        skipped = 0
+        while YtThumbnailCache.usedBytes > YtThumbnailCache.budget and len(cache) > skipped:
+            key = next(iter(cache))
+            if YtThumbnailCache.isPinned(key[0]):
+                cache.move_to_end(key)
+                skipped += 1
+                continue
+            icon = cache.pop(key)
+            YtThumbnailCache.usedBytes -= YtThumbnailCache.iconSize(icon) * 4
+            YtThumbnailCache.evictions += 1
+
+    def thumbnailSaved(videoId: str):
+        """ Forgets what was known about a thumbnail that was just downloaded. """
+        with YtThumbnailCache.lock:
+            YtThumbnailCache.missing.discard(videoId)
+            for size in (0,) + YtThumbnailCache.sizes:
+                icon = YtThumbnailCache.iconCache.pop((videoId, size), None)
+                YtThumbnailCache.usedBytes -= YtThumbnailCache.iconSize(icon) * 4
+        YtThumbnailCache.signals.thumbnailLoaded.emit(videoId)
+
+    def getCachedThumbnail(videoId: str, size: int = 0) -> QtGui.QIcon:
+        """ Returns the thumbnail for the given size, reading it right away if needed. """
+        if videoId == None:
             return None
+        key = (videoId, YtThumbnailCache.fittingSize(size))
+        with YtThumbnailCache.lock:
+            if key in YtThumbnailCache.iconCache:
+                YtThumbnailCache.hits += 1
+                YtThumbnailCache.iconCache.move_to_end(key)
+                return YtThumbnailCache.iconCache[key]
+            YtThumbnailCache.misses += 1
 
-        pixmap = QtGui.QPixmap()
-        pixmap.loadFromData(data)
-        icon = QtGui.QIcon(pixmap)
-        YtThumbnailCache.iconCache[videoId] = icon
+        image = YtThumbnailCache.readImage(videoId, key[1])
+        if image.isNull():
+            return None
+        icon = QtGui.QIcon(QtGui.QPixmap.fromImage(image))
+        YtThumbnailCache.store(key, icon)
         return icon
+
+    def hasThumbnail(videoId: str) -> bool:
+        """ Tells whether there is a thumbnail for the video, without reading it. """
+        if videoId == None:
+            return False
+        with YtThumbnailCache.lock:
+            if (videoId, YtThumbnailCache.listSize) in YtThumbnailCache.iconCache:
+                return True
+        if YtThumbnailStore.contains(videoId):
+            return True
+        return YtThumbnailCache.thumbnailFile(videoId).exists()
+
+    def requestThumbnail(videoId: str, size: int = listSize) -> QtGui.QIcon:
+        """
+        Returns the thumbnail if it is in memory, the placeholder if it is being
+        read and None if there is no thumbnail. Must be called on the GUI thread.
+        """
+        if videoId == None:
+            return None
+        key = (videoId, YtThumbnailCache.fittingSize(size))
+        with YtThumbnailCache.lock:
+            if key in YtThumbnailCache.iconCache:
+                YtThumbnailCache.hits += 1
+                YtThumbnailCache.iconCache.move_to_end(key)
+                return YtThumbnailCache.iconCache[key]
+            if videoId in YtThumbnailCache.missing:
+                return None
+            if key not in YtThumbnailCache.pending:
+                YtThumbnailCache.misses += 1
+                YtThumbnailCache.pending.add(key)
+                YtThumbnailCache.decodePool.start(YtThumbnailDecoder(*key))
+        if YtThumbnailCache.placeholder == None:
+            pixmap = QtGui.QPixmap(72, 72)
+            pixmap.fill(QtGui.QColor(128, 128, 128, 48))
+            YtThumbnailCache.placeholder = QtGui.QIcon(pixmap)
+        return YtThumbnailCache.placeholder
+
+    def imageDecoded(videoId: str, size: int, image: QtGui.QImage):
+        """ Turns decoded images into icons, on the GUI thread, where pixmaps have to be created. """
+        with YtThumbnailCache.lock:
+            YtThumbnailCache.pending.discard((videoId, size))
+            if image.isNull():
+                # Placeholders waiting for it should still go away.
+                YtThumbnailCache.missing.add(videoId)
+            else:
+                YtThumbnailCache.store((videoId, size), QtGui.QIcon(QtGui.QPixmap.fromImage(image)))
+        YtThumbnailCache.signals.thumbnailLoaded.emit(videoId)
+
+    def stop():
+        """ Waits for decoding under way, which must not outlive the application. """
+        YtThumbnailCache.decodePool.clear()
+        YtThumbnailCache.decodePool.waitForDone()
+
+    def statistics() -> str:
+        with YtThumbnailCache.lock:
+            lookups = YtThumbnailCache.hits + YtThumbnailCache.misses
+            hitRate = YtThumbnailCache.hits / lookups if lookups > 0 else 0
+            return (
+                f'Thumbnails in memory: {len(YtThumbnailCache.iconCache)}\n'
+                f'Memory used: {YtThumbnailCache.usedBytes / (1 << 20):.1f} MB '
+                f'of {YtThumbnailCache.budget / (1 << 20):.1f} MB\n'
+                f'Hits: {YtThumbnailCache.hits} ({hitRate:.1%})\n'
+                f'Misses: {YtThumbnailCache.misses}\n'
+                f'Evictions: {YtThumbnailCache.evictions}')
+
+# Created here, on the GUI thread, so that decoded images are always handed
+# over to the GUI thread, whichever thread they were decoded on.
+YtThumbnailCache.signals = YtThumbnailSignals()
+YtThumbnailCache.signals.imageDecoded.connect(YtThumbnailCache.imageDecoded)
+YtThumbnailCache.signals.thumbnailSaved.connect(YtThumbnailCache.thumbnailSaved)
@@ -0,0 +1,185 @@
+import mmap
+import os
+import pathlib
+import struct
+import threading
+import zlib
+
+class YtThumbnailStore:
+    """
+    Keeps thumbnails packed into one file instead of one file per video ID and
+    size, which takes thousands of files to be opened when scrolling through a
+    large playlist for the first time. The pack file is only ever appended to
+    and is mapped into memory for reading, so that thumbnails are decoded right
+    out of the mapping, without reading them into memory first.
+
+    Where each thumbnail is in the pack file is kept in an index file, which is
+    appended to as well. Each entry is written after the thumbnail itself and
+    has a checksum, so that a thumbnail only counts as stored once its entry is
+    complete. An entry cut short, by a crash for example, is dropped when the
+    index is read. Later entries for the same video ID and size replace earlier
+    ones. The index names the pack file it belongs to, so that compacting can
+    write both anew and switch to them by replacing the index file alone.
+
+    Like YtThumbnailCache, this is meant to be a global singleton and has no
+    self attribute.
+    """
+    configPath = pathlib.Path(pathlib.Path.home(), '.qtube')
+    indexPath = pathlib.Path(configPath, 'thumbnails.index')
+    magic = b'QTTI'
+    # Magic and version, followed by the length and name of the pack file.
+    header = struct.Struct('<4sHH')
+    # Checksum, offset, length, width, height, size and video ID length, followed by the video ID.
+    entry = struct.Struct('<IQIHHHB')
+    # (offset, length, width, height) by video ID and size.
+    entries = None
+    packPath = None
+    packFile = None
+    packSize = 0
+    mapping = None
+    indexFile = None
+    lock = threading.Lock()
+
+    def ensureLoaded():
+        if YtThumbnailStore.entries != None:
+            return
+        YtThumbnailStore.configPath.mkdir(parents=True, exist_ok=True)
+        entries = {}
+        packName = 'thumbnails.pack'
+        try:
+            with open(YtThumbnailStore.indexPath, 'rb') as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            data = b''
+        end = 0
+        if len(data) >= YtThumbnailStore.header.size:
+            magic, version, nameLength = YtThumbnailStore.header.unpack_from(data)
+            if magic == YtThumbnailStore.magic and version == 1:
+                end = YtThumbnailStore.header.size + nameLength
+                packName = data[YtThumbnailStore.header.size:end].decode()
+                end = YtThumbnailStore.readEntries(data, end, entries)
+            else:
+                print('Ignoring thumbnail index of an unknown format.')
+
+        packPath = pathlib.Path(YtThumbnailStore.configPath, packName)
+        packFile = open(packPath, 'ab')
+        packSize = packFile.seek(0, os.SEEK_END)
+        # Entries for thumbnails beyond the end of the pack would read garbage.
+        entries = { k: e for (k, e) in entries.items() if e[0] + e[1] <= packSize }
+
+        if end == 0:
+            YtThumbnailStore.writeIndex(YtThumbnailStore.indexPath, packName, {})
+        elif end < len(data):
+            # Drop what came after the last complete entry, so that appends start clean.
+            with open(YtThumbnailStore.indexPath, 'r+b') as fp:
+                fp.truncate(end)
+        YtThumbnailStore.packPath = packPath
+        YtThumbnailStore.packFile = packFile
+        YtThumbnailStore.packSize = packSize
+        YtThumbnailStore.indexFile = open(YtThumbnailStore.indexPath, 'ab')
+        YtThumbnailStore.entries = entries
+
+    def readEntries(data: bytes, position: int, entries: dict) -> int:
+        """ Reads entries into the given dictionary and returns where the last complete one ended. """
+        entry = YtThumbnailStore.entry
+        while position + entry.size <= len(data):
+            checksum, offset, length, width, height, size, idLength = entry.unpack_from(data, position)
+            end = position + entry.size + idLength
+            if end > len(data) or zlib.crc32(data[position + 4:end]) != checksum:
+                break
+            videoId = data[position + entry.size:end].decode()
+            entries[(videoId, size)] = (offset, length, width, height)
+            position = end
+        return position
+
+    def packEntry(videoId: str, size: int, offset: int, length: int, width: int, height: int) -> bytes:
+        record = YtThumbnailStore.entry.pack(0, offset, length, width, height, size, len(videoId.encode()))
+        record += videoId.encode()
+        checksum = zlib.crc32(record[4:])
+        return struct.pack('<I', checksum) + record[4:]
+
+    def writeIndex(path: pathlib.Path, packName: str, entries: dict):
+        name = packName.encode()
+        temporaryPath = path.with_suffix('.tmp')
+        with open(temporaryPath, 'wb') as fp:
+            fp.write(YtThumbnailStore.header.pack(YtThumbnailStore.magic, 1, len(name)))
+            fp.write(name)
+            for ((videoId, size), (offset, length, width, height)) in entries.items():
+                fp.write(YtThumbnailStore.packEntry(videoId, size, offset, length, width, height))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temporaryPath, path)
+
+    def contains(videoId: str, size: int = 0) -> bool:
+        with YtThumbnailStore.lock:
+            YtThumbnailStore.ensureLoaded()
+            return (videoId, size) in YtThumbnailStore.entries
+
+    def add(videoId: str, size: int, data: bytes, width: int, height: int):
+        """ Appends an encoded thumbnail. Can be called from any thread. """
+        with YtThumbnailStore.lock:
+            YtThumbnailStore.ensureLoaded()
+            offset = YtThumbnailStore.packSize
+            YtThumbnailStore.packFile.write(data)
+            YtThumbnailStore.packFile.flush()
+            YtThumbnailStore.packSize += len(data)
+            # Only once the thumbnail is on disk, it is referred to. Otherwise a crash
+            # could leave an index entry behind for data that never made it.
+            os.fsync(YtThumbnailStore.packFile.fileno())
+            YtThumbnailStore.indexFile.write(
+                YtThumbnailStore.packEntry(videoId, size, offset, len(data), width, height))
+            YtThumbnailStore.indexFile.flush()
+            YtThumbnailStore.entries[(videoId, size)] = (offset, len(data), width, height)
+
+    def read(videoId: str, size: int = 0) -> memoryview:
+        """
+        Returns the encoded thumbnail as a view into the mapped pack file, or None.
+        The view stays valid for as long as it is kept, also across appends.
+        """
+        with YtThumbnailStore.lock:
+            YtThumbnailStore.ensureLoaded()
+            entry = YtThumbnailStore.entries.get((videoId, size))
+            if entry == None:
+                return None
+            offset, length = entry[:2]
+            if YtThumbnailStore.mapping == None or len(YtThumbnailStore.mapping) < offset + length:
+                # Mapped anew to cover what was appended. Views into the previous
+                # mapping keep it alive until they are gone.
+                with open(YtThumbnailStore.packPath, 'rb') as fp:
+                    YtThumbnailStore.mapping = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+            return memoryview(YtThumbnailStore.mapping)[offset:offset + length]
+
+    def compact(videoIds: set) -> tuple:
+        """
+        Writes a new pack file with only the latest thumbnails for the given video IDs
+        and switches to it. Returns the number of thumbnails kept and dropped.
+        """
+        with YtThumbnailStore.lock:
+            YtThumbnailStore.ensureLoaded()
+            kept = {}
+            dropped = 0
+            packName = 'thumbnails-1.pack' if YtThumbnailStore.packPath.name != 'thumbnails-1.pack' else 'thumbnails.pack'
+            packPath = pathlib.Path(YtThumbnailStore.configPath, packName)
+            with open(YtThumbnailStore.packPath, 'rb') as source, open(packPath, 'wb') as target:
+                for ((videoId, size), (offset, length, width, height)) in YtThumbnailStore.entries.items():
+                    if videoId not in videoIds:
+                        dropped += 1
+                        continue
+                    source.seek(offset)
+                    kept[(videoId, size)] = (target.tell(), length, width, height)
+                    target.write(source.read(length))
+                target.flush()
+                os.fsync(target.fileno())
+            # Replacing the index is what switches over to the new pack.
+            YtThumbnailStore.indexFile.close()
+            YtThumbnailStore.writeIndex(YtThumbnailStore.indexPath, packName, kept)
+            YtThumbnailStore.packFile.close()
+            YtThumbnailStore.mapping = None
+            oldPackPath = YtThumbnailStore.packPath
+            YtThumbnailStore.entries = None
+            YtThumbnailStore.ensureLoaded()
+            try:
+                oldPackPath.unlink()
+            except OSError as e:
+                print(f'Could not remove old thumbnail pack: {e}')
+            return len(kept), dropped
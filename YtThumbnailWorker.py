@@ -1,7 +1,6 @@
-from PyQt6 import QtCore, QtGui, QtWidgets
-import pathlib
-import urllib, urllib.request
+from PyQt6 import QtCore, QtGui
 
+from YtHttp import YtHttp
 from YtSafeSignal import YtSafeSignal
 from YtThumbnailCache import YtThumbnailCache
 from YtTrackInfoSignals import YtTrackInfoSignals
@@ -16,28 +15,20 @@ class YtThumbnailWorker(QtCore.QRunnable):
 
     def run(self):
         try:
-            icon = self.saveThumbnail(self.iconUrl)
-            YtThumbnailCache.updateThumbnail(self.track.videoId, icon)
-            if icon == None:
+            image = self.saveThumbnail(self.iconUrl)
+            if image == None:
                 return
+            # Thumbnails in memory are dropped on the GUI thread, before the track is updated.
+            YtSafeSignal.emit(YtThumbnailCache.signals.thumbnailSaved, self.track.videoId)
             YtSafeSignal.emit(self.signals.trackUpdated, self.track)
         except Exception as e:
             # Can happen when the HTTP request returns a 404, for example.
             print(f'Could not retrieve icon "{self.iconUrl}":\n{e}')
 
-    def saveThumbnail(self, url) -> QtGui.QIcon():
+    def saveThumbnail(self, url) -> QtGui.QImage:
         if url == None:
             return None
-        data = urllib.request.urlopen(url).read()
+        data = YtHttp.get(url)
 
-        # QPixmap requires a running QApplication. A worker running after application 
-        # shutdown can trigger a SIGABORT and cause an unclean exit.
-        if QtWidgets.QApplication.instance() == None:
-            return
-        pixmap = QtGui.QPixmap()
-        pixmap.loadFromData(data)
-        icon = QtGui.QIcon(pixmap)
-        path = pathlib.Path(pathlib.Path.home(), '.qtube/thumbnails', self.track.videoId)
-        with open(path, 'wb+') as fp:
-            fp.write(data)
-        return icon
\ No newline at end of file
+        # Only pixmaps have to be created on the GUI thread, images do not.
+        return YtThumbnailCache.saveThumbnail(self.track.videoId, data)
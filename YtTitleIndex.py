@@ -0,0 +1,77 @@
+import array
+
+class YtTitleIndex:
+    """
+    Index for filtering a playlist's tracks by title, as the user types. Titles
+    are casefolded once, when tracks are added to the index. For sequences of
+    three characters, the index keeps the tracks whose title contains them, so
+    that only those tracks need to be looked at for terms containing them. When
+    the user keeps typing, the new term contains the previous one, so only the
+    tracks that matched the previous term need to be looked at.
+
+    Tracks for a sequence are looked up the first time a term contains it, since
+    going through all sequences of all titles up front takes a lot longer than
+    the few sequences anyone ever types. They can contain tracks that no longer
+    match, after a title has changed. Every candidate is checked against the
+    term, which makes that harmless.
+    """
+    def __init__(self, tracks: list):
+        self.folded = [track.title.casefold() for track in tracks]
+        self.trigrams = {}
+        self.lastTerm = None
+        self.lastMatches = None
+        # The playlist version this index is up to date with.
+        self.version = None
+
+    def extend(self, tracks: list):
+        for track in tracks:
+            self.folded.append(track.title.casefold())
+            self.addTrigrams(len(self.folded) - 1)
+        self.lastTerm = None
+
+    def update(self, index: int, track):
+        folded = track.title.casefold()
+        if self.folded[index] == folded:
+            return
+        self.folded[index] = folded
+        self.addTrigrams(index)
+        self.lastTerm = None
+
+    def addTrigrams(self, index: int):
+        folded = self.folded[index]
+        for trigram in set(folded[i:i + 3] for i in range(len(folded) - 2)):
+            posting = self.trigrams.get(trigram)
+            if posting != None and (len(posting) == 0 or posting[-1] < index):
+                posting.append(index)
+            elif posting != None and index not in posting:
+                # A title further up has changed. Keep indexes in order.
+                self.trigrams[trigram] = array.array('I', sorted(posting.tolist() + [index]))
+
+    def posting(self, trigram: str) -> array.array:
+        posting = self.trigrams.get(trigram)
+        if posting == None:
+            posting = array.array('I', [i for (i, f) in enumerate(self.folded) if trigram in f])
+            self.trigrams[trigram] = posting
+        return posting
+
+    def search(self, term: str) -> list:
+        """ Returns the indexes of tracks with the term in their title, regardless of case. """
+        term = term.casefold()
+        if term == '':
+            return list(range(len(self.folded)))
+        if self.lastTerm != None and self.lastTerm in term:
+            candidates = self.lastMatches
+        elif len(term) >= 3:
+            trigrams = [term[i:i + 3] for i in range(len(term) - 2)]
+            known = [self.trigrams[t] for t in trigrams if t in self.trigrams]
+            if len(known) > 0:
+                candidates = min(known, key = len)
+            else:
+                candidates = self.posting(trigrams[0])
+        else:
+            candidates = range(len(self.folded))
+        folded = self.folded
+        matches = [i for i in candidates if term in folded[i]]
+        self.lastTerm = term
+        self.lastMatches = matches
+        return matches
@@ -1,31 +1,60 @@
+import sys
+
+from YtSnapshot import YtSnapshot
 from YtThumbnailCache import YtThumbnailCache
 
 class YtTrack:
+    # Tags that most tracks have get a slot of their own. Tracks are smaller that
+    # way and reading these tags, as the track view does all the time, is a plain
+    # attribute access. A slot set to None stands for a missing tag.
+    fields = ('title', 'videoId', 'duration', 'channel', 'position', 'playTime', 'artist', 'album', 'track')
+    attributes = fields + ('playlist', '_extra', '_written', '_history')
+    # Snapshots keep weak references to tracks with tags kept for them.
+    __slots__ = attributes + ('__weakref__',)
+    slots = frozenset(attributes)
+    # Changing these is not a change to the tags.
+    untagged = frozenset(('playlist', '_written', '_history'))
+
     @property
     def icon(self):
         return YtThumbnailCache.getCachedThumbnail(self.videoId)
 
+    def scaledIcon(self, size: int):
+        # Smaller and quicker to read than icon, for showing the thumbnail at that size.
+        # It is read in the background, so this may return the placeholder until
+        # thumbnailLoaded is signalled.
+        return YtThumbnailCache.requestThumbnail(self.videoId, size)
+
+    def hasIcon(self) -> bool:
+        # Unlike icon, this does not read the thumbnail.
+        return YtThumbnailCache.hasThumbnail(self.videoId)
+
     def __init__(self, title: str, playlist = None, **tags):
-        """ 
+        """
         There is a variety of information that could be available for any given track,
         such as Last.fm information, YouTube ID, album, artist, release date, artwork,
         position the user left off playing, and many more. Instead of trying to constrain
         or anticipate all possible future attributes, keep anything optional in a dictionary
         indexed by tags as keys. Those tags represent a given such attribute.
 
-        Everything in those tags will be serialized when saving a playlist and deserialized 
+        Everything in those tags will be serialized when saving a playlist and deserialized
         when loading a playlist. There can also be properties that are associated with a track
         but should not be saved, such as thumbnails. Those will be derived from the videoId or
-        possibly other attributes in the future. This should be flexible enough to possibly 
+        possibly other attributes in the future. This should be flexible enough to possibly
         support other services in the future, such as SoundCloud.
+
+        The most common tags are kept in slots instead. Only tags other than those end up in
+        a dictionary, which is only created for tracks that have any.
         """
         # These will be regular object attributes.
+        for slot in YtTrack.attributes:
+            object.__setattr__(self, slot, None)
         self.playlist = playlist
-        self._tags = tags
 
         # All other attributes to go into tags.
-        self._setattr_pre_init = self._setattr_post_init
         self.title = title
+        for tag in tags:
+            self.__setattr__(tag, tags[tag])
 
         if self.position == None:
             self.position = 0
@@ -33,40 +62,81 @@ class YtTrack:
         if self.playTime == None:
             self.playTime = 0
 
-    def _setattr_post_init(self, k, v):
-        # The attribute is regular class attribute, not a 
-        # tag, so retrieve it as usual. 
-        if k in self.__dict__:
-            super().__setattr__(k, v)
+        # No snapshot can contain a track before it exists.
+        object.__setattr__(self, '_written', YtSnapshot.currentEpoch)
+
+    def __setattr__(self, k, v):
+        if k not in YtTrack.untagged and self._written != None and self._written < YtSnapshot.currentEpoch:
+            self.remember()
+        if k in YtTrack.slots:
+            object.__setattr__(self, k, v)
             return
-        # Otherwise, assign to  a tag. This will be true 
-        # for all member assignments after construction.
-        self._tags[k] = v
+        # Tags without a slot share their keys across all tracks. They are copied
+        # rather than changed, so that snapshots never see them half changed.
+        extra = {} if self._extra == None else dict(self._extra)
+        extra[sys.intern(k)] = v
+        object.__setattr__(self, '_extra', extra)
+
+    def remember(self):
+        """
+        Keeps the tags as they are before the first change since a snapshot was
+        taken, along with the epoch they were replaced in, for as long as there
+        are snapshots older than that. See YtSnapshot.
+        """
+        epoch = YtSnapshot.currentEpoch
+        history = [h for h in (self._history or []) if h[0] > YtSnapshot.oldestEpoch]
+        if epoch > YtSnapshot.oldestEpoch:
+            history.append((epoch, self.getTags()))
+            YtSnapshot.remembering.add(self)
+        # Snapshots read in this order, so the history has to be there first.
+        object.__setattr__(self, '_history', history if len(history) > 0 else None)
+        object.__setattr__(self, '_written', epoch)
 
-    def _setattr_pre_init(self, k, v):
-        super().__setattr__(k, v)
+    def forget(self) -> bool:
+        """ Drops tags no snapshot needs any more, and returns whether any are left. """
+        history = [h for h in (self._history or []) if h[0] > YtSnapshot.oldestEpoch]
+        object.__setattr__(self, '_history', history if len(history) > 0 else None)
+        return len(history) > 0
 
-    def __setattr__(self, k, v):
-        self._setattr_pre_init(k, v)
+    def tagsAt(self, epoch: int) -> dict:
+        """ Returns the tags as they were when the snapshot of the given epoch was taken. """
+        if self._written <= epoch:
+            tags = self.getTags()
+            # Unless a change started meanwhile, these are the tags at that epoch.
+            if self._written <= epoch:
+                return tags
+        for (replaced, tags) in self._history:
+            if replaced > epoch:
+                return tags
 
     def __getattr__(self, a):
-        if a in self._tags:
-            return self._tags[a]
+        # Only called for tags that do not have a slot.
+        if self._extra != None and a in self._extra:
+            return self._extra[a]
         return None
 
     def __repr__(self) -> str:
-        return f'Track: {self._tags}'
+        return f'Track: {self.getTags()}'
 
     def getTags(self) -> dict:
-        return self._tags
+        tags = {}
+        for tag in YtTrack.fields:
+            value = getattr(self, tag)
+            if value != None:
+                tags[tag] = value
+        extra = self._extra
+        if extra != None:
+            tags.update(extra)
+        return tags
 
     def makeCopy(self):
-        tags = { t: self._tags[t] for t in self._tags if t != 'title' }
+        tags = self.getTags()
+        del(tags['title'])
         track = YtTrack(self.title, **tags)
 
         # Copies having their play position and play time reset seems nicer.
         # It also provides the currently only way to reset play time.
         track.position = 0
         track.playTime = 0
-        
-        return track
\ No newline at end of file
+
+        return track
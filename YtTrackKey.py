@@ -0,0 +1,26 @@
+import re
+
+class YtTrackKey:
+    """
+    Key telling tracks apart in search results, so that the same song found
+    twice, such as once on an album and once among its artist's top tracks, is
+    only listed once and only looked up on YouTube once. Tracks of the same
+    video are the same track. Otherwise, artist and track name are used where
+    known, or else the title, without case, punctuation and featured artists,
+    which are written in too many ways to tell songs apart.
+    """
+    # Featured artists in brackets anywhere, or without brackets up to the end.
+    featuring = re.compile(r'[(\[]\s*(feat|ft|featuring)\b[^)\]]*[)\]]?|\s(feat|ft|featuring)\b.*$')
+    punctuation = re.compile(r'[^\w\s]')
+
+    def normalize(text: str) -> str:
+        text = YtTrackKey.featuring.sub(' ', text.casefold())
+        text = YtTrackKey.punctuation.sub(' ', text)
+        return ' '.join(text.split())
+
+    def of(track) -> str:
+        if track.videoId != None:
+            return f'v:{track.videoId}'
+        if track.artist != None and track.track != None:
+            return f'{YtTrackKey.normalize(track.artist)}\t{YtTrackKey.normalize(track.track)}'
+        return YtTrackKey.normalize(track.title)
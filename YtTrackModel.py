@@ -3,6 +3,8 @@ import typing
 
 from YtPlaylistManager import YtPlaylistManager
 from YtPlaylist import YtPlaylist
+from YtThumbnailCache import YtThumbnailCache
+from YtTrack import YtTrack
 from PyQt6 import QtCore, QtGui
 
 class YtColumn():
@@ -54,6 +56,17 @@ class YtTrackModel(QtCore.QAbstractTableModel):
             4: YtColumn('ID', 'videoId', '', flags = QtCore.Qt.ItemFlag.ItemIsEditable),
         }
         self.filterTerm = ''
+        self.modelData = []
+        # Rows by track identity, created when first needed.
+        self.rows = None
+        # Removing more separate ranges of rows than this resets the model instead.
+        self.maxRemovedRanges = 50
+        # Playlists with at least this many tracks are sorted using the arrays
+        # in YtPlaylistColumns, instead of going through each track.
+        self.columnsThreshold = 10000
+        # Tracks shown with a placeholder by the video ID of the thumbnail they are waiting for.
+        self.waitingTracks = {}
+        YtThumbnailCache.signals.thumbnailLoaded.connect(self.thumbnailLoaded)
 
     def columnCount(self, parent: QtCore.QModelIndex = None):
         return len(self.columnMap)
@@ -86,12 +99,17 @@ class YtTrackModel(QtCore.QAbstractTableModel):
             return self.inactiveFont
 
         if role == QtCore.Qt.ItemDataRole.DecorationRole and index.column() == 0:
-           return self.modelData[index.row()].icon
+            # Never wait for thumbnails to be read while painting.
+            track = self.modelData[index.row()]
+            icon = YtThumbnailCache.requestThumbnail(track.videoId)
+            if icon is YtThumbnailCache.placeholder:
+                self.waitingTracks.setdefault(track.videoId, set()).add(track)
+            return icon
 
         if role == QtCore.Qt.ItemDataRole.DisplayRole or role == QtCore.Qt.ItemDataRole.EditRole:
             track = self.modelData[index.row()]
             mapping = self.columnMap[index.column()]
-            value = track.__getattr__(mapping.attribute)
+            value = getattr(track, mapping.attribute)
             key = mapping.getDisplayKey(value)
             return key
 
@@ -100,7 +118,7 @@ class YtTrackModel(QtCore.QAbstractTableModel):
     def setData(self, index, value, role) -> bool:
         attribute = self.columnMap[index.column()].attribute
         track = self.modelData[index.row()]
-        track.__setattr__(attribute, value)
+        setattr(track, attribute, value)
         self.playlistManager.updateTrack(track)
         return True
 
@@ -121,29 +139,90 @@ class YtTrackModel(QtCore.QAbstractTableModel):
             return
         mapping = self.columnMap[column]
         attribute = mapping.attribute
-        key = lambda track: mapping.getSortKey(track.__getattr__(attribute))
-        self.activePlaylist.tracks = sorted(
-            self.activePlaylist.tracks,
-            reverse = (direction == QtCore.Qt.SortOrder.DescendingOrder),
-            key = key)
+        reverse = direction == QtCore.Qt.SortOrder.DescendingOrder
+        columns = self.playlistColumns()
+        if columns != None and columns.supports(attribute):
+            order = columns.sortOrder(attribute, reverse)
+            self.playlistManager.orderPlaylist(self.activePlaylist, order)
+        else:
+            key = lambda track: mapping.getSortKey(getattr(track, attribute))
+            self.playlistManager.sortPlaylist(self.activePlaylist, reverse = reverse, key = key)
         self.filter(self.filterTerm)
         self.modelChanged.emit()
-        self.playlistManager.savePlayingTrack()
 
     def setActivePlaylist(self, playlist: YtPlaylist):
         self.beginResetModel()
         self.activePlaylist = playlist
-        self.modelData = playlist
+        # Keep a list of our own, so that rows can be inserted and removed
+        # at the time the model is meant to change, not before.
+        self.modelData = list(playlist.tracks) if playlist != None else []
+        self.rows = None
         self.endResetModel()
 
+    def trackRow(self, track) -> int:
+        if self.rows == None:
+            self.rows = { id(t): row for (row, t) in enumerate(self.modelData) }
+        row = self.rows.get(id(track), -1)
+        if row < 0 or self.modelData[row] is not track:
+            return -1
+        return row
+
     def trackIndexes(self, tracks) -> typing.List[QtCore.QModelIndex]:
-        if self.modelData == None:
-            return []
-        indices = [
-            self.index(row, 0) for (row, track) 
-            in enumerate(self.modelData) 
-            if track in tracks ]
-        return indices
+        rows = sorted(row for row in map(self.trackRow, tracks) if row >= 0)
+        return [self.index(row, 0) for row in rows]
+
+    def matchesFilter(self, track) -> bool:
+        return self.filterTerm.casefold() in track.title.casefold()
+
+    def tracksAdded(self, tracks: typing.List[YtTrack]):
+        """ Appends rows for tracks that were appended to the active playlist. """
+        tracks = [track for track in tracks if self.matchesFilter(track)]
+        if len(tracks) == 0:
+            return
+        first = len(self.modelData)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(tracks) - 1)
+        self.modelData.extend(tracks)
+        if self.rows != None:
+            for (i, track) in enumerate(tracks):
+                self.rows[id(track)] = first + i
+        self.endInsertRows()
+
+    def tracksRemoved(self, tracks: typing.List[YtTrack]):
+        """ Removes the rows of tracks that were removed from the active playlist. """
+        rows = sorted(row for row in map(self.trackRow, tracks) if row >= 0)
+        if len(rows) == 0:
+            return
+        # Group rows into ranges of consecutive rows.
+        ranges = [[rows[0], rows[0]]]
+        for row in rows[1:]:
+            if row == ranges[-1][1] + 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        if len(ranges) > self.maxRemovedRanges:
+            self.refreshModel()
+            return
+        # Remove from the bottom, so that rows further up stay where they are.
+        for (first, last) in reversed(ranges):
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            del(self.modelData[first:last + 1])
+            self.rows = None
+            self.endRemoveRows()
+
+    def trackUpdated(self, track: YtTrack):
+        row = self.trackRow(track)
+        if row < 0:
+            return
+        left = self.index(row, 0)
+        right = self.index(row, self.columnCount() - 1)
+        self.dataChanged.emit(left, right)
+
+    def thumbnailLoaded(self, videoId: str):
+        for track in self.waitingTracks.pop(videoId, ()):
+            row = self.trackRow(track)
+            if row >= 0:
+                index = self.index(row, 0)
+                self.dataChanged.emit(index, index, [QtCore.Qt.ItemDataRole.DecorationRole])
 
     def activeTrackIndex(self) -> QtCore.QModelIndex:
         activeTrack = self.playlistManager.getActiveTrack()
@@ -157,8 +236,23 @@ class YtTrackModel(QtCore.QAbstractTableModel):
         # filtering of models. However, a previous attempt to use it
         # had resulted in performance issues.
         self.filterTerm = term
+        self.rows = None
         if self.activePlaylist == None:
+            self.modelData = []
+            return
+        tracks = self.activePlaylist.tracks
+        if term == '':
+            self.modelData = list(tracks)
             return
-        self.modelData = [
-            track for track in self.activePlaylist 
-            if term.casefold() in track.title.casefold() ]
+        titleIndex = self.activePlaylist.titleIndex()
+        self.modelData = [tracks[i] for i in titleIndex.search(term)]
+
+    def setFilter(self, term: str):
+        self.beginResetModel()
+        self.filter(term)
+        self.endResetModel()
+
+    def playlistColumns(self):
+        if len(self.activePlaylist) < self.columnsThreshold:
+            return None
+        return self.activePlaylist.columns()
@@ -5,14 +5,16 @@ import typing
 from YtTrackModel import YtTrackModel
 from YtPlaylistManager import YtPlaylistManager
 from YtPlaylist import YtPlaylist
+from YtResolver import YtResolver
+from YtThumbnailCache import YtThumbnailCache
 from YtTrack import YtTrack
-from YtTrackInfoWorker import YtTrackInfoWorker
 
 class YtTrackView(QtWidgets.QTableView):
     findRelatedTracks = QtCore.pyqtSignal(YtTrack)
 
-    def __init__(self, plManager: YtPlaylistManager):
+    def __init__(self, plManager: YtPlaylistManager, resolver: YtResolver):
         super().__init__()
+        self.resolver = resolver
         self.selectedPlaylist = None
         self.dragStart = None
         self.trackSelection = []
@@ -105,12 +107,10 @@ class YtTrackView(QtWidgets.QTableView):
         self.itemModel.sort(column, order)
 
     def searchTriggered(self, term: str):
-        self.itemModel.filter(term)
-        self.itemModel.refreshModel()
+        self.itemModel.setFilter(term)
 
     def searchStopped(self):
-        self.itemModel.filter('')
-        self.itemModel.refreshModel()
+        self.itemModel.setFilter('')
 
     def showContextMenuAtCurrentItem(self):
         index = self.currentIndex()
@@ -136,11 +136,20 @@ class YtTrackView(QtWidgets.QTableView):
         menu.addAction(refreshTracks)
         refreshThumbnails = QtGui.QAction('Refresh &thumbnails', self)
         menu.addAction(refreshThumbnails)
+        resolvePlaylist = QtGui.QAction('&Prepare playlist for playing', self)
+        menu.addAction(resolvePlaylist)
+        showCacheStatistics = QtGui.QAction('Thumbnail &cache statistics', self)
+        menu.addAction(showCacheStatistics)
+        showPlayStatistics = QtGui.QAction('&Listening statistics', self)
+        menu.addAction(showPlayStatistics)
         actionMap = {
             findSimilarTracks: self.findSimilar,
             removeDuplicates: self.removeDuplicates,
             refreshTracks: self.refreshTracks,
             refreshThumbnails: self.refreshThumbnails,
+            resolvePlaylist: self.resolvePlaylist,
+            showCacheStatistics: self.showCacheStatistics,
+            showPlayStatistics: self.showPlayStatistics,
         }
         action = menu.exec(pos)
         if action != None:
@@ -155,22 +164,40 @@ class YtTrackView(QtWidgets.QTableView):
         self.playlistManager.removeDuplicates(self.selectedPlaylist, tracks)
 
     def refreshTracks(self):
-        for track in self.selectedTracks():
-            worker = YtTrackInfoWorker(track, refreshTitle = True)
-            worker.trackUpdated.connect(self.playlistManager.updateTrack)
-            threadPool = QtCore.QThreadPool.globalInstance()
-            threadPool.start(worker)
+        self.resolver.resolve(self.selectedTracks(), refreshTitle = True)
 
     def refreshThumbnails(self):
-        for track in self.selectedTracks():
-            worker = YtTrackInfoWorker(track, refreshThumbnail = True)
-            worker.trackUpdated.connect(self.playlistManager.updateTrack)
-            threadPool = QtCore.QThreadPool.globalInstance()
-            threadPool.start(worker)
+        self.resolver.resolve(self.selectedTracks(), refreshThumbnail = True)
+
+    def resolvePlaylist(self):
+        if self.selectedPlaylist != None:
+            self.resolver.resolvePlaylist(self.selectedPlaylist.tracks)
+
+    def showCacheStatistics(self):
+        self.statisticsMessage = QtWidgets.QMessageBox()
+        self.statisticsMessage.setText(YtThumbnailCache.statistics())
+        self.statisticsMessage.show()
+
+    def showPlayStatistics(self):
+        self.statisticsMessage = QtWidgets.QMessageBox()
+        self.statisticsMessage.setText(self.playlistManager.playLog.statistics())
+        self.statisticsMessage.show()
+
+    def paintEvent(self, event: QtGui.QPaintEvent):
+        # Keep thumbnails of the rows on screen in memory. The rows painted here
+        # are the ones on screen, whatever made them change.
+        first = self.rowAt(0)
+        last = self.rowAt(self.viewport().height() - 1)
+        if first >= 0:
+            if last < 0:
+                last = self.itemModel.rowCount() - 1
+            rows = range(first, last + 1)
+            YtThumbnailCache.pin('trackView', {self.itemModel.modelData[row].videoId for row in rows})
+        super().paintEvent(event)
 
     def trackUpdated(self, track: YtTrack):
         if track.playlist == self.selectedPlaylist:
-            self.refreshView()
+            self.itemModel.trackUpdated(track)
 
     def eventFilter(self, object: QtCore.QObject, event: QtCore.QEvent) -> bool:
         if (event.type() == QtCore.QEvent.Type.KeyPress
@@ -209,12 +236,14 @@ class YtTrackView(QtWidgets.QTableView):
         return super().currentChanged(current, previous)
 
     def tracksRemoved(self, playlist: YtPlaylist, tracks: typing.List[YtTrack]):
+        # Only the affected rows change, so that selections, scroll positions and
+        # editors are kept, even while search results keep coming in.
         if playlist == self.selectedPlaylist:
-            self.refreshModel()
+            self.itemModel.tracksRemoved(tracks)
 
     def tracksAdded(self, playlist: YtPlaylist, tracks: typing.List[YtTrack]):
         if self.selectedPlaylist == playlist:
-            self.refreshModel()        
+            self.itemModel.tracksAdded(tracks)
 
     def refreshModel(self):
         """
@@ -4,12 +4,23 @@ from PyQt6 import QtGui, QtWidgets
 import sys
 
 from YtMainWindow import YtMainWindow
+from YtPlaylistManager import YtPlaylistManager
+from YtThumbnailCache import YtThumbnailCache
 
 if __name__ == "__main__":
     # When being packaged with PyInstaller, these do not get set to
     # the user's shell environment, but to very basic defaults. So,
     # set them here so we can find youtube-dl / yt-dlp.
     os.environ['PATH'] = f'{os.environ["PATH"]}:/usr/local/bin'
+    if '--compact-thumbnails' in sys.argv:
+        # Thumbnails are only kept for tracks in any playlist, history included.
+        manager = YtPlaylistManager()
+        videoIds = { t.videoId for pl in manager.getPlaylists() for t in pl.tracks if t.videoId != None }
+        kept, dropped = YtThumbnailCache.compact(videoIds)
+        print(f'Kept {kept} thumbnails, dropped {dropped}.')
+        # Loading playlists may have changed them, such as by moving the history.
+        manager.flush()
+        sys.exit(0)
     app = QtWidgets.QApplication(sys.argv)
     icon = QtGui.QIcon('icon.ico')
     app.setWindowIcon(icon)